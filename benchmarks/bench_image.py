@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the image rasterization of python-escpos (printer.image()) with the numpy
+pipeline of xml_escpos.raster. python-escpos refuses images wider than the printer
+profile, keep --width within it.
+
+    python benchmarks/bench_image.py --width 512 --height 256 --repeat 20
+"""
+
+import argparse
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image, ImageDraw
+from escpos.printer import Dummy
+from xml_escpos import raster
+
+
+def make_image(width, height):
+    """ a grayscale gradient with a black frame and text, encoded as png """
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    for x in range(width):
+        draw.line((x, 0, x, height), fill=int(255 * x / max(1, width - 1)))
+    draw.rectangle((4, 4, width - 5, height - 5), outline=0)
+    draw.text((20, height // 2), 'xml_escpos raster benchmark', fill=0)
+    out = io.BytesIO()
+    img.save(out, 'PNG')
+    return out.getvalue()
+
+
+def bench_escpos(data, profile):
+    printer = Dummy(profile=profile)
+    printer.image(io.BytesIO(data))
+    return printer.output
+
+
+def bench_raster(data, dither, max_width):
+    return raster.image_to_raster(data, max_width, dither=dither)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--profile', default='TM-T88V', help='python-escpos printer profile')
+    args = parser.parse_args()
+
+    data = make_image(args.width, args.height)
+    max_width = int(Dummy(profile=args.profile).profile.profile_data['media']['width']['pixels'])
+    cases = [('python-escpos image()', lambda: bench_escpos(data, args.profile))]
+    for dither in (raster.DITHER_THRESHOLD, raster.DITHER_ORDERED, raster.DITHER_FLOYD_STEINBERG):
+        cases.append(('raster %s' % dither, lambda dither=dither: bench_raster(data, dither, max_width)))
+
+    print('%dx%d image, best of %d' % (args.width, args.height, args.repeat))
+    for name, func in cases:
+        size = len(func())
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('%-28s %9.3f ms %8d bytes' % (name, best * 1000, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks the receipt rendering pipeline on the receipts of corpus.py, reporting the
+parse time, the render time, the bytes emitted and the device writes issued per receipt.
+
+Receipts are printed on NullPrinter, a DefaultXMLPrinter that counts the text it is
+given, or with --escpos on an EscPosXMLPrinter over a RecordingPrinter for exact byte
+counts; --baudrate then also reports the simulated time to last byte over a serial
+link. With pyperf installed the timings are made by pyperf (all its options apply,
+e.g. -o results.json to compare runs with pyperf compare_to), otherwise with timeit.
+
+    python benchmarks/bench_receipt.py
+    python benchmarks/bench_receipt.py --escpos --buffered --simple --baudrate 19200
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xml_escpos import DefaultXMLPrinter, print_root
+from corpus import CORPUS
+
+try:
+    import pyperf
+except ImportError:
+    pyperf = None
+
+
+class NullPrinter(DefaultXMLPrinter):
+    """
+    Prints nowhere. Counts one device write per printer call and the bytes of the text,
+    barcodes and qr codes; style commands are counted as writes of no bytes.
+    """
+
+    def __init__(self):
+        super(NullPrinter, self).__init__(None)
+        self.bytes = 0
+        self.writes = 0
+
+    def _discard(self, data):
+        self.bytes += len(data)
+        self.writes += 1
+
+    def apply_style(self, stylestack):
+        self.write_raw(b'')
+
+    def text(self, text):
+        self.write_raw(text.encode('utf-8'))
+
+    def barcode(self, code, encoding, **kwargs):
+        self.write_raw(code.encode('utf-8'))
+
+    def qr(self, content, **kwargs):
+        self.write_raw(content.encode('utf-8'))
+
+    def print_base64_image(self, img_src):
+        self.write_raw(b'')
+
+    def cut(self, mode='full'):
+        self.write_raw(b'')
+
+    def cashdraw(self):
+        self.write_raw(b'')
+
+
+def make_printer(escpos, baudrate=None):
+    """ returns the xml printer and its RecordingDevice, None for NullPrinter """
+    if not escpos:
+        return NullPrinter(), None
+    from xml_escpos import EscPosXMLPrinter
+    from xml_escpos.recording import RecordingDevice, RecordingPrinter
+    device = RecordingDevice(baudrate=baudrate)
+    printer = EscPosXMLPrinter(RecordingPrinter(device))
+    device.reset()
+    return printer, device
+
+
+def parse(xml):
+    return ET.fromstring(xml.encode('utf-8'))
+
+
+def render(printer, root, buffered):
+    if buffered:
+        with printer.buffered():
+            print_root(printer, root)
+    else:
+        print_root(printer, root)
+
+
+def output_stats(xml, escpos, buffered, baudrate=None):
+    """ the bytes, writes and simulated time to last byte of printing the receipt once """
+    printer, device = make_printer(escpos, baudrate)
+    render(printer, parse(xml), buffered)
+    if device is None:
+        return printer.bytes, printer.writes, 0.0
+    stats = device.stats()
+    return stats['bytes'], stats['writes'], stats['time_to_last_byte']
+
+
+def add_arguments(parser):
+    parser.add_argument('--escpos', action='store_true',
+                        help='print on an EscPosXMLPrinter (requires python-escpos)')
+    parser.add_argument('--buffered', action='store_true', help='render in buffered mode')
+    parser.add_argument('--baudrate', type=int, help='simulated serial speed with --escpos')
+    parser.add_argument('--receipt', action='append', help='only run these corpus receipts')
+
+
+def forward_arguments(cmd, args):
+    """ passes our options to the pyperf worker processes """
+    if args.escpos:
+        cmd.append('--escpos')
+    if args.buffered:
+        cmd.append('--buffered')
+    if args.baudrate:
+        cmd.extend(('--baudrate', str(args.baudrate)))
+    for name in args.receipt or ():
+        cmd.extend(('--receipt', name))
+
+
+def selected(receipts):
+    return [(name, xml) for name, xml in CORPUS if not receipts or name in receipts]
+
+
+def run_pyperf():
+    runner = pyperf.Runner(add_cmdline_args=forward_arguments)
+    add_arguments(runner.argparser)
+    args = runner.parse_args()
+    for name, xml in selected(args.receipt):
+        size, writes, ttlb = output_stats(xml, args.escpos, args.buffered, args.baudrate)
+        metadata = {'receipt_bytes': size, 'receipt_writes': writes}
+        if args.baudrate:
+            metadata['time_to_last_byte_ms'] = '%.1f' % (ttlb * 1000)
+        runner.bench_func('parse-%s' % name, parse, xml, metadata=metadata)
+        printer, device = make_printer(args.escpos)
+        root = parse(xml)
+        runner.bench_func('render-%s' % name, render, printer, root, args.buffered, metadata=metadata)
+
+
+def run_simple(args):
+    print('%-16s %12s %12s %10s %8s %10s' % ('receipt', 'parse ms', 'render ms', 'bytes', 'writes', 'ttlb ms'))
+    for name, xml in selected(args.receipt):
+        size, writes, ttlb = output_stats(xml, args.escpos, args.buffered, args.baudrate)
+        printer, device = make_printer(args.escpos)
+        root = parse(xml)
+        parse_time = min(timeit.repeat(lambda: parse(xml), number=args.loops, repeat=args.repeat)) / args.loops
+        render_time = min(timeit.repeat(lambda: render(printer, root, args.buffered),
+                                        number=args.loops, repeat=args.repeat)) / args.loops
+        print('%-16s %12.3f %12.3f %10d %8d %10.1f' % (name, parse_time * 1000, render_time * 1000, size, writes,
+                                                      ttlb * 1000))
+
+
+def main():
+    if pyperf is not None and '--simple' not in sys.argv:
+        run_pyperf()
+        return
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument('--simple', action='store_true', help='use timeit even if pyperf is installed')
+    parser.add_argument('--loops', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    run_simple(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
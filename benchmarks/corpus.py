@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Representative receipts for the benchmarks. CORPUS is a list of (name, xml) pairs.
+"""
+
+import base64
+import io
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+# 8x8 black and white png, used as logo when PIL is not installed
+SMALL_PNG = ('iVBORw0KGgoAAAANSUhEUgAAAAgAAAAIAQAAAADsdIMmAAAAGElEQVR42mOoZ3JgUmASYOJgYmFiYmIEAA10AQ3m'
+             'i14LAAAAAElFTkSuQmCC')
+
+
+def logo(width=384, height=96):
+    """ a base64 png logo """
+    if Image is None:
+        return SMALL_PNG
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, width - 1, height - 1), outline=0)
+    draw.ellipse((8, 8, height - 8, height - 8), fill=0)
+    draw.text((height + 8, height // 2 - 6), 'XML ESCPOS STORE', fill=0)
+    out = io.BytesIO()
+    img.save(out, 'PNG')
+    return base64.b64encode(out.getvalue()).decode('ascii')
+
+
+def item_line(i):
+    return (u'<line><left>Item %d <span>x%d</span></left>'
+            u'<right><value value-symbol="$" value-symbol-position="before">%d.%02d</value></right></line>'
+            % (i, i % 5 + 1, i * 3, i % 100))
+
+
+def sale_slip():
+    lines = u''.join(item_line(i) for i in range(6))
+    return (u'<receipt>'
+            u'<h1 align="center">Store</h1>'
+            u'<div align="center">42 Main Street<br/>Tel 555-0100</div>'
+            u'<hr/>' + lines + u'<hr/>'
+            u'<line size="double"><left>Total</left><right><value>123.45</value></right></line>'
+            u'<div align="center"><em>Thank you!</em></div>'
+            u'</receipt>')
+
+
+def report(rows=500):
+    lines = u''.join(item_line(i) for i in range(rows))
+    return (u'<receipt>'
+            u'<h2>End of day report</h2>'
+            u'<section>' + lines + u'</section>'
+            u'<hr/><line><left><b>Total</b></left><right><value>99999.99</value></right></line>'
+            u'</receipt>')
+
+
+def logo_heavy(logos=5):
+    src = logo()
+    body = u''.join(u'<img src="%s"/><p>Promotion %d</p>' % (src, i) for i in range(logos))
+    return u'<receipt>' + body + u'</receipt>'
+
+
+def codes_heavy(count=20):
+    body = u''.join(u'<barcode encoding="EAN13">%012d</barcode><qr>https://example.com/order/%d</qr>'
+                    % (400000000000 + i, i) for i in range(count))
+    return u'<receipt>' + body + u'</receipt>'
+
+
+def deeply_nested(depth=200):
+    return (u'<receipt>' + u'<div><span>' * depth + u'deep <b>text</b>' + u'</span></div>' * depth +
+            u'</receipt>')
+
+
+def many_values(count=1000):
+    body = u''.join(u'<p>%d: <value value-decimals="3" value-autoint="on">%d.%d</value></p>'
+                    % (i, i, i % 7) for i in range(count))
+    return u'<receipt>' + body + u'</receipt>'
+
+
+CORPUS = [
+    ('sale-slip', sale_slip()),
+    ('report-500', report()),
+    ('logo-heavy', logo_heavy()),
+    ('codes-heavy', codes_heavy()),
+    ('deeply-nested', deeply_nested()),
+    ('many-values', many_values()),
+]
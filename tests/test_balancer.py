@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import time
+
+from xml_escpos import EscPosXMLPrinter
+from xml_escpos.balancer import LoadBalancer, PrinterSpeed
+from xml_escpos.recording import RecordingPrinter
+from xml_escpos.spooler import Spooler, JOB_PRINTING, JOB_DONE, JOB_FAILED
+
+from test_spooler import BrokenDevice, xml
+
+
+def counters(*names):
+    """ a spooler with a printer on a BrokenDevice for each name, the first one the fastest """
+    spooler = Spooler()
+    devices = {}
+    speeds = {}
+    for i, name in enumerate(names):
+        devices[name] = BrokenDevice()
+        spooler.add_printer(name, EscPosXMLPrinter(RecordingPrinter(devices[name])))
+        speeds[name] = PrinterSpeed(bytes_per_second=3000 // (i + 1))
+    return spooler, devices, speeds
+
+
+def test_failed_job_falls_back_to_another_printer():
+    spooler, devices, speeds = counters('c1', 'c2')
+    balancer = LoadBalancer(spooler, speeds)
+    devices['c1'].broken = True
+    job = balancer.submit(xml('order 1'))
+    assert job.result(5).status == JOB_DONE
+    assert [attempt.printer_name for attempt in job.attempts] == ['c1', 'c2']
+    assert job.printer_name == 'c2' and b'order 1' in devices['c2'].data
+    # the failed printer is avoided until its cooldown is over
+    devices['c1'].broken = False
+    assert balancer.submit(xml('order 2')).result(5).printer_name == 'c2'
+    balancer.failed_at['c1'] -= balancer.cooldown
+    assert balancer.submit(xml('order 3')).result(5).printer_name == 'c1'
+    spooler.close()
+
+
+def test_job_fails_after_its_attempts():
+    spooler, devices, speeds = counters('c1', 'c2', 'c3')
+    balancer = LoadBalancer(spooler, speeds, max_attempts=2)
+    for device in devices.values():
+        device.broken = True
+    job = balancer.submit(xml('order 1'))
+    assert job.wait(5) and job.status == JOB_FAILED and isinstance(job.error, IOError)
+    assert [attempt.printer_name for attempt in job.attempts] == ['c1', 'c2']
+    spooler.close()
+
+
+def test_job_is_printing_with_its_attempt():
+    spooler, devices, speeds = counters('c1', 'c2')
+    balancer = LoadBalancer(spooler, speeds)
+    devices['c1'].released.clear()
+    job = balancer.submit(xml('order 1'))
+    deadline = time.time() + 5
+    while job.attempts[0].started is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.status == JOB_PRINTING and job.started == job.attempts[0].started
+    assert job.queue_time is not None and not job.cancel()
+    devices['c1'].released.set()
+    assert job.result(5).status == JOB_DONE and job.print_time is not None
+    spooler.close()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from xml_escpos.cache import ReceiptCache
+
+
+def xml(i):
+    return u'<receipt><p>receipt %d</p></receipt>' % i
+
+
+def test_least_recently_used_receipts_are_evicted():
+    cache = ReceiptCache(max_entries=2)
+    first = cache.get_program(xml(0))
+    cache.get_program(xml(1))
+    assert cache.get_program(xml(0)) is first  # 0 is now the most recently used
+    cache.get_program(xml(2))
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+    assert cache.get_program(xml(0)) is first
+    assert cache.stats()['misses'] == 3  # 1 was evicted, 0 was not
+
+
+def test_rendered_bytes_count_in_the_size():
+    cache = ReceiptCache(max_bytes=200)
+    key = cache.key(xml(0))
+    cache.get_program(xml(0), key)
+    cache.put_rendered(key, ('printer',), b'x' * 100, 'CP437')
+    assert cache.get_rendered(key, ('printer',)) == (b'x' * 100, 'CP437')
+    assert cache.get_rendered(key, ('other printer',)) is None
+    assert cache.stats()['bytes'] == len(xml(0)) + 100
+    cache.put_rendered(key, ('printer',), b'x' * 300)
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from xml_escpos import EscPosXMLPrinter, receipt
+from xml_escpos.fanout import receipt_fanout
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+
+XML = u'<receipt><p>Ж</p></receipt>'  # cyrillic, not in the default code page
+
+
+class OfflineDevice(RecordingDevice):
+    def write(self, data):
+        raise IOError('offline')
+
+
+def make_printer(device_class=RecordingDevice):
+    return EscPosXMLPrinter(RecordingPrinter(device_class()))
+
+
+def printed(printer):
+    return bytes(printer.printer.device.data)
+
+
+def test_fanout_prints_on_every_printer():
+    printers = [make_printer(), make_printer(), make_printer(OfflineDevice)]
+    results = receipt_fanout(printers, XML)
+    assert [result.ok for result in results] == [True, True, False]
+    assert isinstance(results[2].error, IOError)
+    assert printed(printers[0]) == printed(printers[1])
+    assert results[0].bytes == len(printed(printers[0]))
+
+
+def test_fanout_selects_the_code_page_of_each_printer():
+    in_cyrillic, in_latin, narrow = make_printer(), make_printer(), make_printer()
+    receipt(in_cyrillic, XML)
+    receipt(in_latin, u'<receipt><p>\xe9</p></receipt>')
+    narrow.image_width = lambda: 384
+    starts = [len(printed(printer)) for printer in (in_cyrillic, in_latin)]
+    assert all(result.ok for result in receipt_fanout([in_cyrillic, in_latin, narrow], XML))
+    for printer, start in zip((in_cyrillic, in_latin), starts):
+        assert b'\x1bt\x11' in printed(printer)[start:]
+    assert in_cyrillic.device_state() == in_latin.device_state() == narrow.device_state()
+    assert in_cyrillic.render_key() != narrow.render_key()
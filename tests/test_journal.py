@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from xml_escpos import EscPosXMLPrinter
+from xml_escpos.journal import JobJournal
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+from xml_escpos.spooler import Spooler, JOB_DONE
+
+from test_spooler import BrokenDevice, xml
+
+
+def spooler_on(journal, devices):
+    spooler = Spooler(journal=journal)
+    for name, device in devices.items():
+        spooler.add_printer(name, EscPosXMLPrinter(RecordingPrinter(device)))
+    return spooler
+
+
+def test_replay_prints_the_unfinished_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    # a first process prints one job, fails one, and dies while printing the third
+    device = BrokenDevice()
+    spooler = spooler_on(JobJournal(path), {'kitchen': device})
+    assert spooler.submit('kitchen', xml('printed')).result(5).status == JOB_DONE
+    device.broken = True
+    assert spooler.submit('kitchen', xml('failed')).wait(5)
+    device.broken = False
+    device.released.clear()
+    printing = spooler.submit('kitchen', xml('printing'))
+    spooler.submit('kitchen', xml('queued'))
+    while printing.started is None:
+        printing.wait(0.01)
+    spooler.journal.commit()
+
+    journal = JobJournal(path)
+    assert [(name, attempts) for job_id, name, job_xml, attempts in journal.unfinished()] == \
+        [('kitchen', 1), ('kitchen', 0)]
+    replayed_device = RecordingDevice()
+    replayed = spooler_on(journal, {'kitchen': replayed_device})
+    jobs = replayed.replay()
+    assert [job.result(5).status for job in jobs] == [JOB_DONE, JOB_DONE]
+    replayed.close()
+    data = bytes(replayed_device.data)
+    assert data.index(b'printing') < data.index(b'queued')
+    assert b'printed' not in data and b'failed' not in data
+    assert journal.unfinished() == []
+    assert journal.counts() == {'done': 3, 'failed': 1}
+
+    device.broken = True
+    device.released.set()
+    spooler.close()
+    journal.close()
+
+
+def test_replay_leaves_the_jobs_of_other_printers(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    journal.add('bar', xml('lemonade'))
+    journal.add('kitchen', xml('burger'))
+    device = RecordingDevice()
+    spooler = spooler_on(journal, {'kitchen': device})
+    assert [job.result(5).status for job in spooler.replay()] == [JOB_DONE]
+    spooler.close()
+    assert b'burger' in device.data
+    assert [name for job_id, name, job_xml, attempts in journal.unfinished()] == ['bar']
+    journal.close()
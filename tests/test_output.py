@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Byte level checks of the escpos output, recorded with RecordingDevice.
+"""
+
+import io
+import re
+
+from xml_escpos import EscPosXMLPrinter, receipt, receipt_stream, compile_receipt
+from xml_escpos.buffer import FlushPolicy
+from xml_escpos.cache import ReceiptCache
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+from xml_escpos.resume import ReceiptProgress, receipt_resumable
+
+
+RECEIPT = u'''<receipt sheet="roll">
+  <h1>Store</h1>
+  <div align="center">Hello <b>World</b> tail text
+    <span>inline</span> after</div>
+  <line><left>Coffee</left><right><value value-decimals="2">3.5</value></right></line>
+  <line size="double"><left>Total</left><right>
+    <value value-symbol="$" value-symbol-position="before">1234.5</value></right></line>
+  <hr/>
+  <pre>  keep   spaces </pre>
+  <p>para<br/>next</p>
+  <barcode encoding="EAN13">123456789012</barcode>
+  <em>small <u>x</u></em>
+  <partialcut/>
+</receipt>'''
+
+CODE_PAGE_COMMAND = re.compile(b'\x1bt(.)', re.S)
+
+
+class FailingDevice(RecordingDevice):
+    """ raises an IOError, once, on the write that would take it over fail_at bytes """
+
+    def __init__(self, fail_at, **kwargs):
+        super(FailingDevice, self).__init__(**kwargs)
+        self.fail_at = fail_at
+
+    def write(self, data):
+        if self.fail_at is not None and len(self.data) + len(data) > self.fail_at:
+            self.fail_at = None
+            raise IOError('paper out')
+        return super(FailingDevice, self).write(data)
+
+
+STYLE_COMMAND = re.compile(b'\x1b([a!r\\-EM])(.)', re.S)  # align, size, color, underline, bold, font
+
+
+def styled_bytes(data):
+    """
+    the bytes printed other than the style commands, each with the style it is printed in,
+    to compare outputs that reach the same styles with different commands
+    """
+    state = {}
+    styled = []
+    position = 0
+    for match in STYLE_COMMAND.finditer(data):
+        style = tuple(sorted(state.items()))
+        styled.extend((data[i:i + 1], style) for i in range(position, match.start()))
+        command, value = match.groups()
+        if command == b'!':  # ESC ! resets underline, bold and font
+            state.update({b'-': b'\x00', b'E': b'\x00', b'M': b'\x00'})
+        state[command] = value
+        position = match.end()
+    style = tuple(sorted(state.items()))
+    styled.extend((data[i:i + 1], style) for i in range(position, len(data)))
+    return styled
+
+
+def code_pages(data):
+    """ the bytes printed outside of ascii, each with the code page it is printed in """
+    printed = []
+    page = None
+    position = 0
+    for match in list(CODE_PAGE_COMMAND.finditer(data)) + [None]:
+        end = len(data) if match is None else match.start()
+        printed.extend((data[i:i + 1], page) for i in range(position, end) if data[i:i + 1] >= b'\x80')
+        if match is not None:
+            page = match.group(1)
+            position = match.end()
+    return printed
+
+
+def make_printer(device=None):
+    device = device if device is not None else RecordingDevice()
+    return EscPosXMLPrinter(RecordingPrinter(device)), device
+
+
+def printed(print_receipt, printer_class=EscPosXMLPrinter):
+    device = RecordingDevice()
+    print_receipt(printer_class(RecordingPrinter(device)))
+    return bytes(device.data)
+
+
+class FullCutPrinter(EscPosXMLPrinter):
+    """ a printer with the cut() of the first versions, without modes """
+    cuts = 0
+
+    def cut(self):
+        self.cuts += 1
+        self.printer.cut()
+
+
+def test_compiled_receipt():
+    plain = printed(lambda printer: receipt(printer, RECEIPT))
+    assert b'Store' in plain and b'$1,234.50' in plain
+    # compiled programs merge the style changes made between two texts
+    compiled = printed(lambda printer: compile_receipt(RECEIPT).execute(printer))
+    assert styled_bytes(compiled) == styled_bytes(plain)
+    assert len(compiled) <= len(plain)
+
+
+def test_compiled_receipt_cuts_like_receipt():
+    xml = u'<receipt><p>a</p><cut/></receipt>'
+    printer = FullCutPrinter(RecordingPrinter(RecordingDevice()))
+    compile_receipt(xml).execute(printer)
+    assert printer.cuts == 2  # the cut element and the end of the receipt
+    assert printed(lambda printer: compile_receipt(xml).execute(printer), FullCutPrinter) == \
+        printed(lambda printer: receipt(printer, xml), FullCutPrinter)
+
+
+def test_cached_receipt():
+    compiled = printed(lambda printer: compile_receipt(RECEIPT).execute(printer))
+    cache = ReceiptCache()
+    for i in range(2):
+        assert printed(lambda printer: receipt(printer, RECEIPT, cache=cache)) == compiled
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_buffered_receipt():
+    plain = printed(lambda printer: receipt(printer, RECEIPT))
+    printer, device = make_printer()
+    receipt(printer, RECEIPT, buffered=True)
+    assert bytes(device.data) == plain and device.writes == 1
+    printer, device = make_printer()
+    receipt(printer, RECEIPT, buffered=True, flush_policy=FlushPolicy(chunk_size=50))
+    assert bytes(device.data) == plain and max(device.write_sizes) == 50
+
+
+def test_cached_buffered_receipt():
+    compiled = printed(lambda printer: compile_receipt(RECEIPT).execute(printer))
+    cache = ReceiptCache()
+    for i in range(3):
+        assert printed(lambda printer: receipt(printer, RECEIPT, cache=cache, buffered=True)) == compiled
+    assert cache.stats()['rendered_hits'] == 2
+
+
+def test_cached_bytes_select_their_code_page():
+    xml = u'<receipt><p>\u0416</p></receipt>'  # cyrillic, not in the default code page
+    cache = ReceiptCache()
+    printer, device = make_printer()
+    receipt(printer, xml)  # the printer is left in the cyrillic code page
+    receipt(printer, xml, cache=cache, buffered=True)
+    other, other_device = make_printer()
+    receipt(other, u'<receipt><p>\xe9</p></receipt>')
+    start = len(other_device.data)
+    receipt(other, xml, cache=cache, buffered=True)
+    assert cache.stats()['rendered_hits'] == 1
+    replayed = bytes(other_device.data[start:])
+    assert replayed.index(b'\x1bt') < replayed.index(b'\n')
+    # the encoder knows the code page the replayed bytes left the printer in
+    assert other.device_state() == printer.device_state()
+    start = len(other_device.data)
+    receipt(other, u'<receipt><p>\xe9</p></receipt>')
+    assert b'\x1bt' in bytes(other_device.data[start:])
+
+
+def test_render_key_depends_on_the_image_width():
+    printer, device = make_printer()
+    other, other_device = make_printer()
+    assert printer.render_key() == other.render_key()
+    other.image_width = lambda: 384
+    assert printer.render_key() != other.render_key()
+
+
+def test_streamed_receipt():
+    plain = printed(lambda printer: receipt(printer, RECEIPT))
+    chunks = [RECEIPT[i:i + 7] for i in range(0, len(RECEIPT), 7)]
+    assert printed(lambda printer: receipt_stream(printer, chunks)) == plain
+    source = io.BytesIO(RECEIPT.encode('utf-8'))
+    assert printed(lambda printer: receipt_stream(printer, source)) == plain
+
+
+def test_style_deltas_across_size_changes():
+    printer, device = make_printer()
+    receipt(printer, u'<receipt cut="false"><p>a</p><p>b</p><p size="double">c</p>'
+                     u'<p size="double" bold="on">d</p><p>e</p></receipt>')
+    data = bytes(device.data)
+
+    def between(before, after):
+        start = data.index(before) + len(before)
+        return data[start:data.index(after, start)]
+
+    # unchanged styles are not sent again
+    assert between(b'a\n', b'b') == b''
+    # ESC ! resets underline, bold and font, which are sent again after it;
+    # align and color are unchanged
+    assert between(b'b\n', b'c') == b'\x1b!0\x1b-\x00\x1bE\x00\x1bM\x00'
+    assert between(b'c\n', b'd').endswith(b'\x1b!0\x1b-\x00\x1bE\x01\x1bM\x00')
+    assert between(b'd\n', b'e') == b'\x1b!\x00\x1b-\x00\x1bE\x00\x1bM\x00'
+
+
+def fail_resume(printer, xml):
+    """ prints the xml on a printer whose device fails, then resumes it """
+    progress = ReceiptProgress()
+    try:
+        receipt_resumable(printer, xml, progress)
+    except IOError:
+        pass
+    else:
+        raise AssertionError('the device did not fail')
+    assert not progress.done
+    blocks = progress.blocks
+    receipt_resumable(printer, xml, progress)
+    assert progress.done and progress.attempts == 2
+    return blocks
+
+
+def test_resume_after_io_error():
+    lines = [u'line %02d' % i for i in range(30)]
+    xml = u'<receipt>%s</receipt>' % u''.join(u'<p>%s</p>' % line for line in lines)
+    device = FailingDevice(fail_at=200)
+    printer, device = make_printer(device)
+    blocks = fail_resume(printer, xml)
+    assert 0 < blocks < len(lines)
+    data = bytes(device.data)
+    first, rest = data[:200], data[data.index(b'- continued -'):]
+    assert all(line.encode('ascii') in first for line in lines[:blocks])
+    for i, line in enumerate(lines):
+        assert (line.encode('ascii') in rest) == (i >= blocks)
+    assert rest.endswith(b'\x1dV\x00')
+
+
+def test_resume_selects_the_code_page_again():
+    xml = u'<receipt><p>first</p><p>\xe9 \u041f\u0440\u0438\u0432\u0435\u0442 \xe9</p><p>\xe9 last</p></receipt>'
+    reference = printed(lambda printer: receipt(printer, xml))
+    cyrillic = reference.index(b'\x1bt\x11')
+    # fails on the code page switch back, after the cyrillic text was written
+    printer, device = make_printer(FailingDevice(fail_at=reference.index(b'\x1bt', cyrillic + 3)))
+    assert fail_resume(printer, xml) == 1
+    # e acute is 0x82 in code page 0, and a cyrillic letter in code page 17
+    pages = set(code_pages(bytes(device.data)))
+    assert (b'\x82', b'\x00') in pages and (b'\x82', b'\x11') not in pages
+    assert pages == set(code_pages(reference))
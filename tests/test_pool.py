@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import socket
+
+import pytest
+
+from xml_escpos import receipt
+from xml_escpos.pool import PrinterPool, PrinterUnavailable
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+
+
+class SocketDevice(RecordingDevice):
+    """ a RecordingDevice on one end of a socket pair, the printer holding the other end """
+
+    def __init__(self):
+        super(SocketDevice, self).__init__()
+        self.sock, self.peer = socket.socketpair()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self, size, flags=0):
+        return self.sock.recv(size, flags)
+
+
+class Connector(object):
+    """ opens RecordingPrinters, or fails while unreachable """
+
+    def __init__(self, device_class=RecordingDevice):
+        self.device_class = device_class
+        self.printers = []
+        self.unreachable = False
+
+    def __call__(self, host, port, timeout):
+        if self.unreachable:
+            raise socket.error('connection refused')
+        printer = RecordingPrinter(self.device_class())
+        self.printers.append(printer)
+        return printer
+
+
+def xml(text):
+    return u'<receipt><p>%s</p></receipt>' % text
+
+
+def test_connection_is_reused():
+    connect = Connector()
+    pool = PrinterPool(connect)
+    for text in ('first', 'second'):
+        with pool.printer('10.0.0.12') as printer:
+            receipt(printer, xml(text))
+    assert len(connect.printers) == 1
+    data = bytes(connect.printers[0].device.data)
+    assert b'first' in data and b'second' in data
+    assert pool.stats() == {'10.0.0.12:9100': {'connected': True, 'connects': 1, 'failures': 0}}
+
+
+def test_failed_job_drops_the_connection():
+    connect = Connector()
+    pool = PrinterPool(connect)
+    with pytest.raises(IOError):
+        with pool.printer('10.0.0.12'):
+            raise IOError('broken pipe')
+    assert pool.stats()['10.0.0.12:9100']['connected'] is False
+    with pool.printer('10.0.0.12') as printer:
+        receipt(printer, xml('again'))
+    assert len(connect.printers) == 2 and b'again' in connect.printers[1].device.data
+
+
+def test_unreachable_printer_is_retried_with_a_backoff():
+    connect = Connector()
+    connect.unreachable = True
+    pool = PrinterPool(connect, backoff=10)
+    for i in range(2):
+        with pytest.raises(PrinterUnavailable):
+            with pool.printer('10.0.0.12'):
+                pass
+    conn = pool.connection('10.0.0.12')
+    assert conn.failures == 1  # the second attempt waited for the backoff
+    connect.unreachable = False
+    conn.retry_at = 0.0
+    with pool.printer('10.0.0.12') as printer:
+        receipt(printer, xml('back'))
+    assert conn.failures == 0 and conn.connects == 1
+
+
+def test_closed_and_idle_connections_are_reopened():
+    connect = Connector(SocketDevice)
+    pool = PrinterPool(connect, max_idle=60)
+    with pool.printer('10.0.0.12'):
+        pass
+    connect.printers[0].device.peer.close()  # the printer dropped the connection
+    with pool.printer('10.0.0.12'):
+        pass
+    assert len(connect.printers) == 2
+    pool.connection('10.0.0.12').last_used -= 120
+    with pool.printer('10.0.0.12'):
+        pass
+    assert len(connect.printers) == 3
+    pool.close()
+    for printer in connect.printers:
+        printer.device.sock.close()
+        printer.device.peer.close()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from xml_escpos import EscPosXMLPrinter, receipt
+from xml_escpos.profiling import ReceiptProfile, ProfiledPrinter
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+
+RECEIPT = u'''<receipt cut="false">
+  <h1>Store</h1>
+  <p>Coffee</p>
+  <p>Tea</p>
+  <hr/>
+  <barcode encoding="EAN13">123456789012</barcode>
+</receipt>'''
+
+
+def profiled(**options):
+    device = RecordingDevice()
+    profile = ReceiptProfile()
+    receipt(EscPosXMLPrinter(RecordingPrinter(device)), RECEIPT, profile=profile, **options)
+    return profile.summary(), device
+
+
+def test_tags_count_their_bytes():
+    for buffered in (False, True):
+        summary, device = profiled(buffered=buffered)
+        tags = summary['tags']
+        assert summary['bytes'] == len(device.data)
+        assert sum(tag['bytes'] for tag in tags.values()) == len(device.data)
+        assert tags['p']['count'] == 2 and tags['p']['bytes'] >= len('Coffee\nTea\n')
+        assert tags['hr']['bytes'] >= 48 and tags['barcode']['bytes'] > 12
+
+
+def test_merge_adds_up_profiles():
+    total = ReceiptProfile()
+    for i in range(2):
+        profile = ReceiptProfile()
+        profile.add_tag('p', 0.5, 10)
+        total.merge(profile)
+    assert total.summary()['tags']['p'] == {'time': 1.0, 'count': 2, 'bytes': 20}
+
+
+def test_profiled_printer_is_its_own_class():
+    printer = EscPosXMLPrinter(RecordingPrinter())
+    wrapped = ProfiledPrinter(printer, ReceiptProfile())
+    assert wrapped.__class__ is ProfiledPrinter
+    assert wrapped.render_key() == printer.render_key()
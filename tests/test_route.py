@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from xml_escpos import EscPosXMLPrinter
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+from xml_escpos.route import receipt_routed
+
+ORDER = u'''<receipt>
+    <h1>Order 42</h1>
+    <section printer="grill">2 x Burger</section>
+    <section printer="bar, expo">1 x Lemonade</section>
+</receipt>'''
+
+
+def printers(*names):
+    return dict((name, EscPosXMLPrinter(RecordingPrinter(RecordingDevice()))) for name in names)
+
+
+def printed(printer):
+    return bytes(printer.printer.device.data)
+
+
+def test_sections_go_to_their_printers():
+    kitchen = printers('grill', 'bar', 'expo', 'office')
+    assert sorted(receipt_routed(kitchen, ORDER)) == ['bar', 'expo', 'grill']
+    assert b'Order 42' in printed(kitchen['grill']) and b'Burger' in printed(kitchen['grill'])
+    assert b'Lemonade' not in printed(kitchen['grill'])
+    assert b'Lemonade' in printed(kitchen['bar']) and b'Burger' not in printed(kitchen['expo'])
+    assert printed(kitchen['office']) == b''
+
+
+def test_unknown_printers_go_to_the_default_printer():
+    kitchen = printers('grill', 'expo')
+    assert sorted(receipt_routed(kitchen, ORDER, default='expo')) == ['expo', 'grill']
+    with pytest.raises(KeyError):
+        receipt_routed(printers('grill', 'expo'), ORDER)
+
+
+def test_receipt_without_routed_sections():
+    xml = u'<receipt><p>Order 43</p></receipt>'
+    kitchen = printers('grill', 'bar')
+    assert receipt_routed(kitchen, xml, default='bar') == ['bar']
+    assert b'Order 43' in printed(kitchen['bar'])
+    kitchen = printers('grill', 'bar')
+    with pytest.raises(ValueError):
+        receipt_routed(kitchen, xml)
+    assert printed(kitchen['grill']) == printed(kitchen['bar']) == b''
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import pytest
+
+from xml_escpos import EscPosXMLPrinter
+from xml_escpos.recording import RecordingDevice, RecordingPrinter
+from xml_escpos.spooler import Spooler, SpoolerFull, JOB_DONE, JOB_FAILED, JOB_CANCELLED
+
+
+class BrokenDevice(RecordingDevice):
+    """ raises an IOError on every write while broken, blocks its writes while held """
+
+    def __init__(self, **kwargs):
+        super(BrokenDevice, self).__init__(**kwargs)
+        self.broken = False
+        self.released = threading.Event()
+        self.released.set()
+
+    def write(self, data):
+        self.released.wait(5)
+        if self.broken:
+            raise IOError('paper out')
+        return super(BrokenDevice, self).write(data)
+
+
+class BrokenJournal(object):
+    """ a journal failing when a job starts or ends """
+
+    def __init__(self):
+        self.ids = 0
+
+    def add(self, printer_name, xml):
+        self.ids += 1
+        return self.ids
+
+    def start(self, job_id):
+        if job_id == 1:
+            raise IOError('disk full')
+
+    def done(self, job_id):
+        raise IOError('disk full')
+
+    def failed(self, job_id, error):
+        raise IOError('disk full')
+
+    def cancelled(self, job_id):
+        pass
+
+    def commit(self):
+        pass
+
+
+def xml(text):
+    return u'<receipt><p>%s</p></receipt>' % text
+
+
+def spooler_on(device, **kwargs):
+    spooler = Spooler(**kwargs)
+    spooler.add_printer('kitchen', EscPosXMLPrinter(RecordingPrinter(device)))
+    return spooler
+
+
+def test_failing_printer_fails_the_job_not_the_worker():
+    device = BrokenDevice()
+    spooler = spooler_on(device)
+    device.broken = True
+    failed = spooler.submit('kitchen', xml('first'))
+    assert failed.wait(5) and failed.status == JOB_FAILED and isinstance(failed.error, IOError)
+    device.broken = False
+    job = spooler.submit('kitchen', xml('second'))
+    assert job.result(5).status == JOB_DONE
+    assert b'second' in device.data and b'first' not in device.data
+    assert spooler.stats()['kitchen'] == {'pending': 0, 'printed': 1, 'failed': 1}
+    spooler.close()
+
+
+def test_failing_journal_fails_the_job_not_the_worker(caplog):
+    device = RecordingDevice()
+    spooler = spooler_on(device, journal=BrokenJournal())
+    with caplog.at_level(logging.ERROR, logger='xml_escpos.spooler'):
+        first = spooler.submit('kitchen', xml('first'))
+        second = spooler.submit('kitchen', xml('second'))
+        assert first.wait(5) and second.wait(5)
+        spooler.close()  # the done callbacks have run once the worker is stopped
+    assert first.status == JOB_FAILED and str(first.error) == 'disk full'
+    assert second.status == JOB_DONE and b'second' in device.data
+    # the journal failed to record the end of both jobs
+    assert len([record for record in caplog.records if record.exc_info]) == 2
+
+
+def test_failing_callback_is_logged(caplog):
+    device = BrokenDevice()
+    device.released.clear()  # the job ends once its callbacks are added
+    spooler = spooler_on(device)
+    called = []
+    with caplog.at_level(logging.ERROR, logger='xml_escpos.spooler'):
+        job = spooler.submit('kitchen', xml('first'))
+        job.add_done_callback(lambda job: 1 / 0)
+        job.add_done_callback(called.append)
+        device.released.set()
+        # the worker prints the next job after calling the callbacks of the first
+        assert spooler.submit('kitchen', xml('second')).result(5).status == JOB_DONE
+    assert called == [job]
+    assert caplog.records[0].exc_info[0] is ZeroDivisionError
+    spooler.close()
+
+
+def test_full_queue_cancels_the_job():
+    device = BrokenDevice()
+    device.released.clear()
+    spooler = spooler_on(device, maxsize=1)
+    printing = spooler.submit('kitchen', xml('printing'))
+    while printing.started is None:
+        printing.wait(0.01)
+    queued = spooler.submit('kitchen', xml('queued'))
+    with pytest.raises(SpoolerFull):
+        spooler.submit('kitchen', xml('rejected'))
+    assert queued.cancel() and queued.status == JOB_CANCELLED
+    device.released.set()
+    assert printing.result(5).status == JOB_DONE
+    spooler.close()
+    assert b'printing' in device.data and b'queued' not in device.data
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import socket
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from xml_escpos.recording import RecordingDevice
+from xml_escpos.status import (PrinterStatus, StatusMonitor, DLE_EOT_PRINTER, DLE_EOT_OFFLINE,
+                               DLE_EOT_PAPER)
+
+ASB_READY = b'\x14\x00\x00\x0f'
+ASB_PAPER_OUT = b'\x14\x00\x0c\x0f'
+
+
+class FakeLink(object):
+    """ the link to a printer: what it sends is queued for read(), what it gets is recorded """
+
+    def __init__(self):
+        self.received = queue.Queue()
+        self.device = RecordingDevice()
+        self.reads = 0
+
+    def send(self, data):
+        self.received.put(data)
+
+    def read(self):
+        self.reads += 1
+        try:
+            return self.received.get(timeout=0.01)
+        except queue.Empty:
+            raise socket.timeout()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_status_bytes():
+    status = PrinterStatus()
+    assert status.ready and status.online is None
+    status.update_asb(bytearray(ASB_PAPER_OUT))
+    assert status.online and status.paper_out and not status.ready
+    status.update_asb(bytearray(b'\x3c\x40\x03\x0f'))  # drawer, offline, cover open, near end
+    assert status.drawer_open and not status.online and status.cover_open
+    assert status.paper_near_end and not status.paper_out and not status.error
+    status = PrinterStatus()
+    status.update_dle_eot(DLE_EOT_PRINTER, 0x12)
+    status.update_dle_eot(DLE_EOT_OFFLINE, 0x12)
+    status.update_dle_eot(DLE_EOT_PAPER, 0x12)
+    assert status.online and not status.drawer_open and status.ready
+    status.update_dle_eot(DLE_EOT_OFFLINE, 0x32)
+    assert status.paper_out and not status.ready
+
+
+def test_monitor_follows_automatic_status_back():
+    link = FakeLink()
+    changes = []
+    monitor = StatusMonitor(link.read, link.device.write, poll_interval=60, on_change=changes.append)
+    monitor.start()
+    try:
+        assert bytes(link.device.data) == b'\x1da\x0f'  # automatic status back enabled
+        link.send(ASB_READY[:2])  # the status may come in pieces
+        link.send(ASB_READY[2:] + ASB_PAPER_OUT)
+        assert wait_for(lambda: monitor.status.paper_out)
+        assert not monitor.ready and [status.ready for status in changes] == [False]
+        link.send(ASB_READY)
+        assert wait_for(lambda: monitor.ready)
+    finally:
+        monitor.stop()
+
+
+def test_monitor_polls_with_dle_eot():
+    link = FakeLink()
+    monitor = StatusMonitor(link.read, link.device.write, asb=False)
+    monitor.start()
+    try:
+        monitor.poll()
+        assert bytes(link.device.data) == b'\x10\x04\x01\x10\x04\x02\x10\x04\x04'
+        link.send(b'\x16\x12')  # online, then cover closed and paper in
+        link.send(b'\x7e\x72')  # not a status, then paper out
+        assert wait_for(lambda: monitor.status.paper_out)
+        status = monitor.status
+        assert status.online and not status.cover_open and not monitor.ready
+    finally:
+        monitor.stop()
+
+
+def test_closed_connection_is_reported_offline():
+    reads = []
+
+    def read():
+        reads.append(time.time())
+        return b''
+
+    monitor = StatusMonitor(read, RecordingDevice().write, poll_interval=0.02, asb=False, max_backoff=0.08)
+    monitor.start()
+    try:
+        assert wait_for(lambda: monitor.status.online is False)
+        time.sleep(0.3)
+        # read again after a delay doubling up to max_backoff, instead of spinning
+        assert 3 <= len(reads) <= 10
+    finally:
+        monitor.stop()
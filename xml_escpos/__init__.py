@@ -8,14 +8,34 @@ import re
 import xml.etree.ElementTree as ET
 from escpos.constants import *
 import base64
+import io
 import tempfile
+from contextlib import contextmanager
+from timeit import default_timer
+from xml_escpos.buffer import RenderBuffer, FlushPolicy
+from xml_escpos.profiling import ReceiptProfile, ProfiledPrinter
+from xml_escpos import raster
 
-TXT_DOUBLE = '\x1b\x21\x30'  # Double height & Width
+TXT_DOUBLE = b'\x1b\x21\x30'  # Double height & Width
 BARCODE_DOUBLE_WIDTH = 2
 BARCODE_HRI_TOP = 1
 TXT_COLOR_BLACK = ESC + b'\x72\x00'
 TXT_COLOR_RED = ESC + b'\x72\x01'
 
+try:
+    TXT_ALIGN_LT
+except NameError:  # python-escpos 3 only has these commands in its TXT_STYLE table
+    TXT_ALIGN_LT = ESC + b'\x61\x00'
+    TXT_ALIGN_CT = ESC + b'\x61\x01'
+    TXT_ALIGN_RT = ESC + b'\x61\x02'
+    TXT_UNDERL_OFF = ESC + b'\x2d\x00'
+    TXT_UNDERL_ON = ESC + b'\x2d\x01'
+    TXT_UNDERL2_ON = ESC + b'\x2d\x02'
+    TXT_BOLD_OFF = ESC + b'\x45\x00'
+    TXT_BOLD_ON = ESC + b'\x45\x01'
+    TXT_2HEIGHT = ESC + b'\x21\x10'
+    TXT_2WIDTH = ESC + b'\x21\x20'
+
 try:
     import jcconv
 except ImportError:
@@ -26,6 +46,11 @@ try:
 except ImportError:
     qrcode = None
 
+try:
+    basestring
+except NameError:  # python 3
+    basestring = str
+
 
 def utfstr(stuff):
     """ converts stuff to string and does without failing if stuff is a utf8 string """
@@ -40,10 +65,17 @@ class StyleStack:
     The stylestack is used by the xml receipt serializer to compute the active styles along the xml
     document. Styles are just xml attributes, there is no css mechanism. But the style applied by
     the attributes are inherited by deeper nodes.
+
+    Each level of the stack holds the fully resolved style dictionnary. Levels that don't change
+    any style share the dictionnary of the level below, it is only copied when a style is set.
     """
 
+    typed_values = {}  # (attr, val) -> val converted to the attribute's type, shared by all stacks
+    typed_values_max = 4096
+
     def __init__(self):
         self.stack = []
+        self.owned = []  # whether the dictionnary of a level is its own or shared with the level below
         self.defaults = {  # default style values
             'align': 'left',
             'underline': 'off',
@@ -77,20 +109,30 @@ class StyleStack:
         }
         self.escpos_keys = ['align', 'underline', 'bold', 'font', 'size', 'color']
 
-        self.push(self.defaults)
+        self.stack.append({})
+        self.owned.append(True)
+        self.set(self.defaults)
 
     def get(self, style):
         """ what's the value of a style at the current stack level"""
-        level = len(self.stack) - 1
-        while level >= 0:
-            if style in self.stack[level]:
-                return self.stack[level][style]
-            else:
-                level = level - 1
-        return None
+        return self.stack[-1].get(style)
 
     def enforce_type(self, attr, val):
         """converts a value to the attribute's type"""
+        key = (attr, val)
+        try:
+            return self.typed_values[key]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable value
+            return self._convert(attr, val)
+        typed = self._convert(attr, val)
+        if len(self.typed_values) >= self.typed_values_max:
+            self.typed_values.clear()
+        self.typed_values[key] = typed
+        return typed
+
+    def _convert(self, attr, val):
         if not attr in self.types:
             return utfstr(val)
         elif self.types[attr] == 'int':
@@ -102,27 +144,33 @@ class StyleStack:
 
     def push(self, style={}):
         """push a new level on the stack with a style dictionnary containing style:value pairs"""
-        _style = {}
-        for attr in style:
-            _style[attr] = self.enforce_type(attr, style[attr])
-        self.stack.append(_style)
+        self.stack.append(self.stack[-1])
+        self.owned.append(False)
+        self.set(style)
 
     def set(self, style={}):
         """overrides style values at the current stack level"""
-        _style = {}
+        if not style:
+            return
+        if not self.owned[-1]:
+            self.stack[-1] = dict(self.stack[-1])
+            self.owned[-1] = True
+        _style = self.stack[-1]
         for attr in style:
-            self.stack[-1][attr] = self.enforce_type(attr, style[attr])
+            _style[attr] = self.enforce_type(attr, style[attr])
 
     def pop(self):
         """ pop a style stack level """
         if len(self.stack) > 1:
-            self.stack = self.stack[:-1]
+            self.stack.pop()
+            self.owned.pop()
 
     def get_styles(self):
         """ Get actual styles in stack """
+        _style = self.stack[-1]
         ret = {}
         for style in self.escpos_keys:
-            ret[style] = self.get(style)
+            ret[style] = _style.get(style)
         return ret
 
 
@@ -131,11 +179,15 @@ class XmlSerializer:
     Converts the xml inline / block tree structure to a string,
     keeping track of newlines and spacings.
     The string is outputted asap to the provided escpos driver.
+    blocks counts the blocks ended so far; checkpoint, if set, is called with that count
+    after each block ends, once its text has been given to the printer.
     """
 
-    def __init__(self, printer):
+    def __init__(self, printer, checkpoint=None):
         self.printer = printer
         self.stack = ['block']
+        self.blocks = 0
+        self.checkpoint = checkpoint
 
     def start_inline(self, stylestack=None):
         """ starts an inline entity with an optional style definition """
@@ -151,12 +203,18 @@ class XmlSerializer:
 
     def end_entity(self):
         """ ends the entity definition. (but does not cancel the active style!) """
-        if self.stack[-1] == 'block':
+        block = self.stack[-1] == 'block'
+        if block:
             self.printer.text('\n')
 
         if len(self.stack) > 1:
             self.stack = self.stack[:-1]
 
+        if block:
+            self.blocks += 1
+            if self.checkpoint is not None:
+                self.checkpoint(self.blocks)
+
     def pre(self, text):
         """ puts a string of text in the entity keeping the whitespace intact """
         if text:
@@ -247,48 +305,168 @@ class XmlLineSerializer:
             self.width - self.clwidth - self.crwidth) + self.rbuffer
 
 
-def receipt(printer, xml):
+ELEM_STYLES = {
+    'h1': {'bold': 'on', 'size': 'double'},
+    'h2': {'size': 'double'},
+    'h3': {'bold': 'on', 'size': 'double-height'},
+    'h4': {'size': 'double-height'},
+    'h5': {'bold': 'on'},
+    'em': {'font': 'b'},
+    'b': {'bold': 'on'},
+}
+
+BLOCK_TAGS = ('p', 'div', 'section', 'article', 'receipt', 'header', 'footer', 'li', 'h1', 'h2', 'h3', 'h4', 'h5')
+INLINE_TAGS = ('span', 'em', 'b', 'left', 'right')
+
+
+def strclean(string):
+    if not string:
+        string = ''
+    string = string.strip()
+    string = re.sub('\s+', ' ', string)
+    return string
+
+
+def format_value(value, decimals=3, width=0, decimals_separator='.', thousands_separator=',', autoint=False,
+                 symbol='', position='after'):
+    decimals = max(0, int(decimals))
+    width = max(0, int(width))
+    value = float(value)
+
+    if autoint and math.floor(value) == value:
+        decimals = 0
+    if width == 0:
+        width = ''
+
+    if thousands_separator:
+        formatstr = "{:" + str(width) + ",." + str(decimals) + "f}"
+    else:
+        formatstr = "{:" + str(width) + "." + str(decimals) + "f}"
+
+    ret = formatstr.format(value)
+    ret = ret.replace(',', 'COMMA')
+    ret = ret.replace('.', 'DOT')
+    ret = ret.replace('COMMA', thousands_separator)
+    ret = ret.replace('DOT', decimals_separator)
+
+    if symbol:
+        if position == 'after':
+            ret = ret + symbol
+        else:
+            ret = symbol + ret
+    return ret
+
+
+class TagHandler(object):
     """
-    Prints an xml based receipt definition
+    Prints the elements of an xml tag. The styles of the handler are the default styles of
+    the tag, they are applied before the attributes of the element. Handlers are registered
+    for a tag with register_tag().
+
+    Handlers printing child elements make render() a generator that yields a
+    (child, serializer, indent) tuple for each child to print; the child is printed
+    before the generator is resumed.
     """
+    styles = None
+
+    def __init__(self, styles=None):
+        if styles is not None:
+            self.styles = styles
+
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        """ prints the element, with its styles already pushed on the stylestack """
+        pass
+
 
-    def strclean(string):
-        if not string:
-            string = ''
-        string = string.strip()
-        string = re.sub('\s+', ' ', string)
-        return string
-
-    def format_value(value, decimals=3, width=0, decimals_separator='.', thousands_separator=',', autoint=False,
-                     symbol='', position='after'):
-        decimals = max(0, int(decimals))
-        width = max(0, int(width))
-        value = float(value)
-
-        if autoint and math.floor(value) == value:
-            decimals = 0
-        if width == 0:
-            width = ''
-
-        if thousands_separator:
-            formatstr = "{:" + str(width) + ",." + str(decimals) + "f}"
+class EntityHandler(TagHandler):
+    """ block or inline entities, which print their text and children """
+
+    def __init__(self, block, styles=None):
+        super(EntityHandler, self).__init__(styles)
+        self.block = block
+
+    def start(self, serializer, stylestack):
+        if self.block:
+            serializer.start_block(stylestack)
         else:
-            formatstr = "{:" + str(width) + "." + str(decimals) + "f}"
+            serializer.start_inline(stylestack)
 
-        ret = formatstr.format(value)
-        ret = ret.replace(',', 'COMMA')
-        ret = ret.replace('.', 'DOT')
-        ret = ret.replace('COMMA', thousands_separator)
-        ret = ret.replace('DOT', decimals_separator)
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        self.start(serializer, stylestack)
+        serializer.text(elem.text)
+        for child in elem:
+            yield child, serializer, 0
+            print_tail(stylestack, serializer, child)
+        serializer.end_entity()
+
+
+class ValueHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        serializer.start_inline(stylestack)
+        serializer.pre(format_value(
+            elem.text,
+            decimals=stylestack.get('value-decimals'),
+            width=stylestack.get('value-width'),
+            decimals_separator=stylestack.get('value-decimals-separator'),
+            thousands_separator=stylestack.get('value-thousands-separator'),
+            autoint=(stylestack.get('value-autoint') == 'on'),
+            symbol=stylestack.get('value-symbol'),
+            position=stylestack.get('value-symbol-position')
+        ))
+        serializer.end_entity()
+
+
+class LineHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        width = stylestack.get('width')
+        if stylestack.get('size') in ('double', 'double-width'):
+            width = width // 2
+
+        lineserializer = XmlLineSerializer(stylestack.get('indent') + indent, stylestack.get('tabwidth'), width,
+                                           stylestack.get('line-ratio'))
+        serializer.start_block(stylestack)
+        for child in elem:
+            if child.tag == 'left':
+                yield child, lineserializer, indent
+            elif child.tag == 'right':
+                lineserializer.start_right()
+                yield child, lineserializer, indent
+        serializer.pre(lineserializer.get_line())
+        serializer.end_entity()
+
+
+class PreHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        serializer.start_block(stylestack)
+        serializer.pre(elem.text)
+        serializer.end_entity()
 
-        if symbol:
-            if position == 'after':
-                ret = ret + symbol
-            else:
-                ret = symbol + ret
-        return ret
 
-    def print_barcode(stylestack, serializer, elem):
+class HrHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        width = stylestack.get('width')
+        if stylestack.get('size') in ('double', 'double-width'):
+            width = width // 2
+        serializer.start_block(stylestack)
+        serializer.text('-' * width)
+        serializer.end_entity()
+
+
+class BrHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        serializer.linebreak()
+
+
+class ImgHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        if 'src' in elem.attrib:
+            printer.print_base64_image(elem.attrib['src'])
+
+
+class BarcodeHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        if not 'encoding' in elem.attrib:
+            return
         serializer.start_block(stylestack)
         kwargs = {'align_ct': elem.attrib['align_ct'] == 'on' if 'align_ct' in elem.attrib else False}
         if 'height' in elem.attrib:
@@ -296,11 +474,13 @@ def receipt(printer, xml):
         if 'width' in elem.attrib:
             kwargs['width'] = int(elem.attrib['width'])
         if 'pos' in elem.attrib:
-            kwargs['pos'] = elem.attrib['pos']        
+            kwargs['pos'] = elem.attrib['pos']
         printer.barcode(strclean(elem.text), elem.attrib['encoding'], **kwargs)
         serializer.end_entity()
 
-    def print_qr(stylestack, serializer, elem):
+
+class QrHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
         serializer.start_block(stylestack)
         kwargs = {}
         if 'ec_level' in elem.attrib:
@@ -310,124 +490,282 @@ def receipt(printer, xml):
         printer.qr(strclean(elem.text), **kwargs)
         serializer.end_entity()
 
-    def print_elem(stylestack, serializer, elem, indent=0):
-
-        elem_styles = {
-            'h1': {'bold': 'on', 'size': 'double'},
-            'h2': {'size': 'double'},
-            'h3': {'bold': 'on', 'size': 'double-height'},
-            'h4': {'size': 'double-height'},
-            'h5': {'bold': 'on'},
-            'em': {'font': 'b'},
-            'b': {'bold': 'on'},
-        }
 
-        stylestack.push()
-        if elem.tag in elem_styles:
-            stylestack.set(elem_styles[elem.tag])
-        stylestack.set(elem.attrib)
+class CutHandler(TagHandler):
+    def __init__(self, mode='full'):
+        super(CutHandler, self).__init__()
+        self.mode = mode
 
-        if elem.tag in (
-                'p', 'div', 'section', 'article', 'receipt', 'header', 'footer', 'li', 'h1', 'h2', 'h3', 'h4', 'h5'):
-            serializer.start_block(stylestack)
-            serializer.text(elem.text)
-            for child in elem:
-                print_elem(stylestack, serializer, child)
-                serializer.start_inline(stylestack)
-                serializer.text(child.tail)
-                serializer.end_entity()
-            serializer.end_entity()
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        if self.mode == 'full':
+            printer.cut()
+        else:
+            printer.cut(mode=self.mode)
 
-        elif elem.tag in ('span', 'em', 'b', 'left', 'right'):
-            serializer.start_inline(stylestack)
-            serializer.text(elem.text)
-            for child in elem:
-                print_elem(stylestack, serializer, child)
-                serializer.start_inline(stylestack)
-                serializer.text(child.tail)
-                serializer.end_entity()
-            serializer.end_entity()
 
-        elif elem.tag == 'value':
-            serializer.start_inline(stylestack)
-            serializer.pre(format_value(
-                elem.text,
-                decimals=stylestack.get('value-decimals'),
-                width=stylestack.get('value-width'),
-                decimals_separator=stylestack.get('value-decimals-separator'),
-                thousands_separator=stylestack.get('value-thousands-separator'),
-                autoint=(stylestack.get('value-autoint') == 'on'),
-                symbol=stylestack.get('value-symbol'),
-                position=stylestack.get('value-symbol-position')
-            ))
-            serializer.end_entity()
-
-        elif elem.tag == 'line':
-            width = stylestack.get('width')
-            if stylestack.get('size') in ('double', 'double-width'):
-                width = width / 2
-
-            lineserializer = XmlLineSerializer(stylestack.get('indent') + indent, stylestack.get('tabwidth'), width,
-                                               stylestack.get('line-ratio'))
-            serializer.start_block(stylestack)
-            for child in elem:
-                if child.tag == 'left':
-                    print_elem(stylestack, lineserializer, child, indent=indent)
-                elif child.tag == 'right':
-                    lineserializer.start_right()
-                    print_elem(stylestack, lineserializer, child, indent=indent)
-            serializer.pre(lineserializer.get_line())
-            serializer.end_entity()
-
-        elif elem.tag == 'pre':
-            serializer.start_block(stylestack)
-            serializer.pre(elem.text)
-            serializer.end_entity()
+class CashdrawHandler(TagHandler):
+    def render(self, printer, stylestack, serializer, elem, indent=0):
+        printer.cashdraw()
 
-        elif elem.tag == 'hr':
-            width = stylestack.get('width')
-            if stylestack.get('size') in ('double', 'double-width'):
-                width = width / 2
-            serializer.start_block(stylestack)
-            serializer.text('-' * width)
-            serializer.end_entity()
 
-        elif elem.tag == 'br':
-            serializer.linebreak()
+TAG_HANDLERS = {}  # tag -> TagHandler
+UNKNOWN_TAG = TagHandler()
 
-        elif elem.tag == 'img':
-            if 'src' in elem.attrib:
-                printer.print_base64_image(elem.attrib['src'])
 
-        elif elem.tag == 'barcode' and 'encoding' in elem.attrib:
-            print_barcode(stylestack, serializer, elem)
+def register_tag(tag, handler):
+    """
+    Registers the TagHandler printing the elements of a tag, replacing the previous handler
+    if the tag already has one. The handler applies to all the receipts printed afterwards.
+    """
+    TAG_HANDLERS[tag] = handler
+
+
+for _tag in BLOCK_TAGS:
+    register_tag(_tag, EntityHandler(True, ELEM_STYLES.get(_tag)))
+for _tag in INLINE_TAGS:
+    register_tag(_tag, EntityHandler(False, ELEM_STYLES.get(_tag)))
+register_tag('value', ValueHandler())
+register_tag('line', LineHandler())
+register_tag('pre', PreHandler())
+register_tag('hr', HrHandler())
+register_tag('br', BrHandler())
+register_tag('img', ImgHandler())
+register_tag('barcode', BarcodeHandler())
+register_tag('qr', QrHandler())
+register_tag('cut', CutHandler())
+register_tag('partialcut', CutHandler('part'))
+register_tag('cashdraw', CashdrawHandler())
+
+
+def print_elem(printer, stylestack, serializer, elem, indent=0, profile=None):
+    """
+    Prints an element and its children. The tree is walked with an explicit stack of the
+    handlers being rendered instead of recursive calls, so nesting depth is not limited
+    by the python recursion limit. The time spent on each tag and the bytes it produced,
+    its children excluded, are recorded in the ReceiptProfile if one is given.
+    """
+    rendering = []  # (handler generator, tag)
+    render = start_elem(printer, stylestack, serializer, elem, indent, profile)
+    if render is not None:
+        rendering.append((render, elem.tag))
+    while rendering:
+        render, tag = rendering[-1]
+        if profile is not None:
+            start = default_timer()
+            size = _emitted(printer)
+        try:
+            child, child_serializer, child_indent = next(render)
+        except StopIteration:
+            child = None
+        if profile is not None:
+            profile.add_tag(tag, default_timer() - start, _emitted(printer) - size, 0)
+        if child is None:
+            rendering.pop()
+            stylestack.pop()
+            continue
+        render = start_elem(printer, stylestack, child_serializer, child, child_indent, profile)
+        if render is not None:
+            rendering.append((render, child.tag))
+
+
+def _emitted(printer):
+    """ the bytes a ProfiledPrinter has produced so far, 0 for other printers """
+    emitted = getattr(printer, 'emitted', None)
+    return emitted() if emitted is not None else 0
+
+
+def push_styles(stylestack, elem, handler):
+    """ pushes the styles of an element: the ones of its TagHandler, then its attributes """
+    stylestack.push()
+    if handler.styles:
+        stylestack.set(handler.styles)
+    stylestack.set(elem.attrib)
+
+
+def start_elem(printer, stylestack, serializer, elem, indent, profile=None):
+    """
+    Pushes the styles of an element and renders it. Returns the generator of the handler
+    when it has children to print, the styles are then popped by print_elem() once it ends.
+    """
+    handler = TAG_HANDLERS.get(elem.tag, UNKNOWN_TAG)
+    if profile is not None:
+        start = default_timer()
+    push_styles(stylestack, elem, handler)
+    if profile is not None:
+        styled = default_timer()
+        profile.add_phase('style', styled - start)
+        size = _emitted(printer)
+    render = handler.render(printer, stylestack, serializer, elem, indent)
+    if profile is not None:
+        profile.add_tag(elem.tag, default_timer() - styled, _emitted(printer) - size)
+    if render is None:
+        stylestack.pop()
+    return render
 
-        elif elem.tag == 'qr':
-            print_qr(stylestack, serializer, elem)
 
-        elif elem.tag == 'cut':
-            printer.cut()
-        elif elem.tag == 'partialcut':
-            printer.cut(mode='part')
-        elif elem.tag == 'cashdraw':
-            printer.cashdraw(2)
-            printer.cashdraw(5)
+def print_tail(stylestack, serializer, elem):
+    """ prints the text following an element, in the style of its parent """
+    serializer.start_inline(stylestack)
+    serializer.text(elem.tail)
+    serializer.end_entity()
 
-        stylestack.pop()
 
-    stylestack = StyleStack()
-    serializer = XmlSerializer(printer)
-    root = ET.fromstring(xml.encode('utf-8'))
+def start_receipt(printer, root):
+    """ applies the attributes of the receipt root element before printing it """
     if 'sheet' in root.attrib and root.attrib['sheet'] == 'slip':
         printer.set_sheet_slip_mode()
         printer.slip_sheet_mode = True
 
-    print_elem(stylestack, serializer, root)
 
+def end_receipt(printer, root):
+    """ applies the attributes of the receipt root element after printing it """
     if not 'cut' in root.attrib or root.attrib['cut'] == 'true':
         printer.cut()
 
 
+def receipt(printer, xml, cache=None, buffered=False, flush_policy=None, profile=None):
+    """
+    Prints an xml based receipt definition. If a ReceiptCache is given, the receipt
+    is compiled once and reprints of the same xml skip the parsing.
+    If buffered, the whole receipt is rendered in memory and written to the device
+    at the end, in writes sized according to flush_policy (a FlushPolicy).
+    With both a cache and buffered, the rendered bytes are cached per printer render_key().
+    If a ReceiptProfile is given, the timings, bytes and writes of the job are added to it.
+    """
+    if profile is not None and not isinstance(printer, ProfiledPrinter):
+        printer = ProfiledPrinter(printer, profile)
+        with printer.job():
+            receipt(printer, xml, cache, buffered, flush_policy, profile)
+        return
+
+    if buffered:
+        with printer.buffered(flush_policy) as output:
+            if cache is None:
+                receipt(printer, xml, profile=profile)
+            else:
+                start = default_timer()
+                key = cache.key(xml)
+                render_key = printer.render_key()
+                rendered = cache.get_rendered(key, render_key)
+                if rendered is not None:
+                    data, state = rendered
+                    output.write(data)
+                    printer.set_device_state(state)
+                    if profile is not None:
+                        profile.add_phase('cache', default_timer() - start)
+                else:
+                    program = cache.get_program(xml, key)
+                    if profile is not None:
+                        profile.add_phase('cache', default_timer() - start)
+                    printer.forget_device_state()
+                    program.execute(printer)
+                    if not output.written:
+                        cache.put_rendered(key, render_key, bytes(output.data), printer.device_state())
+        return
+
+    if cache is not None:
+        start = default_timer()
+        program = cache.get_program(xml)
+        if profile is not None:
+            profile.add_phase('cache', default_timer() - start)
+        program.execute(printer)
+        return
+
+    start = default_timer()
+    root = ET.fromstring(xml.encode('utf-8'))
+    if profile is not None:
+        profile.add_phase('parse', default_timer() - start)
+    print_root(printer, root, profile)
+
+
+def print_root(printer, root, profile=None):
+    """
+    Prints an already parsed receipt definition
+    """
+    printer.reset_style()
+    stylestack = StyleStack()
+    serializer = XmlSerializer(printer)
+    start_receipt(printer, root)
+    print_elem(printer, stylestack, serializer, root, profile=profile)
+    end_receipt(printer, root)
+
+
+class _ChunkReader(object):
+    """ file like reader over an iterable of xml chunks, for ElementTree.iterparse """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def read(self, size=-1):
+        for chunk in self.chunks:
+            if chunk:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                return chunk
+        return b''
+
+
+def receipt_stream(printer, source):
+    """
+    Prints an xml based receipt definition read from a file object or from an iterable
+    of xml chunks. The receipt is parsed incrementally: block and inline entities are
+    started as soon as their opening tag is read, other elements are printed as soon as
+    they are complete, and printed elements are dropped from the tree, so the memory
+    used does not grow with the length of the receipt.
+    """
+    if not hasattr(source, 'read'):
+        source = _ChunkReader(source)
+
+    printer.reset_style()
+    stylestack = StyleStack()
+    serializer = XmlSerializer(printer)
+    root = None
+    entities = []  # the block and inline elements being printed
+    pending_text = None  # entity whose text is not printed yet
+    pending_tail = None  # printed element whose tail is not printed yet
+    whole = None  # element being parsed, that will be printed once complete
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if whole is not None and elem is not whole:
+            continue
+
+        # the text of an entity and the tail of an element are only known
+        # once the parser has reached the next tag
+        if pending_text is not None:
+            serializer.text(pending_text.text)
+            pending_text.text = None
+            pending_text = None
+        if pending_tail is not None:
+            print_tail(stylestack, serializer, pending_tail)
+            entities[-1].remove(pending_tail)
+            pending_tail = None
+
+        if event == 'start':
+            if root is None:
+                root = elem
+                start_receipt(printer, root)
+            handler = TAG_HANDLERS.get(elem.tag, UNKNOWN_TAG)
+            if isinstance(handler, EntityHandler):
+                push_styles(stylestack, elem, handler)
+                handler.start(serializer, stylestack)
+                entities.append(elem)
+                pending_text = elem
+            else:
+                whole = elem
+        else:
+            if elem is whole:
+                whole = None
+                print_elem(printer, stylestack, serializer, elem)
+            else:
+                serializer.end_entity()
+                stylestack.pop()
+                entities.pop()
+            if entities:
+                pending_tail = elem
+
+    end_receipt(printer, root)
+
+
 class DefaultXMLPrinter(object):
     def __init__(self, printer):
         self.printer = printer
@@ -441,6 +779,29 @@ class DefaultXMLPrinter(object):
     def apply_style(self, stylestack):
         pass
 
+    def reset_style(self):
+        """ forgets the style the device is in, the next apply_style() sends it in full """
+        pass
+
+    def render_key(self):
+        """ what the bytes a receipt renders to depend on besides its xml, their ReceiptCache key """
+        return (self.__class__,)
+
+    def forget_device_state(self):
+        """
+        forgets the state the device is in (style, code page), so that the next output sets
+        it in full and can be written as is to any printer with the same render_key()
+        """
+        self.reset_style()
+
+    def device_state(self):
+        """ the state the last output left the device in, besides its style """
+        return None
+
+    def set_device_state(self, state):
+        """ after writing bytes rendered by another printer, takes over its device_state() """
+        self.reset_style()
+
     def text(self, text):
         pass
 
@@ -450,12 +811,57 @@ class DefaultXMLPrinter(object):
     def qr(self, content, ec=0, size=6, model=2, native=False):
         pass
 
-    def cut(self):
+    def print_base64_image(self, img_src):
+        pass
+
+    def cut(self, mode='full'):
         pass
 
     def cashdraw(self):
         pass
 
+    def raw_output(self):
+        """ returns the (object, method name) that receives the raw bytes sent to the device """
+        return self, '_discard'
+
+    def _discard(self, data):
+        pass
+
+    def write_raw(self, data):
+        """ sends raw bytes to the device """
+        output, method = self.raw_output()
+        getattr(output, method)(data)
+
+    @contextmanager
+    def redirected(self, write):
+        """
+        Sends the raw output of the printer to write(data) inside the with block. Yields the
+        function the output was sent to before, to forward the data to the device.
+        """
+        output, method = self.raw_output()
+        previous = output.__dict__.get(method)
+        device_write = getattr(output, method)
+        setattr(output, method, write)
+        try:
+            yield device_write
+        finally:
+            if previous is None:
+                delattr(output, method)
+            else:
+                setattr(output, method, previous)
+
+    @contextmanager
+    def buffered(self, policy=None):
+        """
+        Renders everything printed inside the with block in a RenderBuffer, and writes it to
+        the device when the block ends, as configured by the FlushPolicy.
+        """
+        output, method = self.raw_output()
+        buf = RenderBuffer(getattr(output, method), policy)
+        with self.redirected(buf.write):
+            yield buf
+        buf.flush()
+
 
 class DarumaXMLPrinter(DefaultXMLPrinter):
 
@@ -476,7 +882,7 @@ class DarumaXMLPrinter(DefaultXMLPrinter):
     def qr(self, content, ec=0, size=6, model=2, native=False):
         pass
 
-    def cut(self):
+    def cut(self, mode='full'):
         self.printer.text("\n\n\n\n\n")
         self.printer.device.write('\x1B\x6D')
 
@@ -494,11 +900,32 @@ class DarumaXMLPrinter(DefaultXMLPrinter):
     def cashdraw(self):
         self.printer.device.write('\x1B\x70')
 
+    def raw_output(self):
+        return self.printer.device, 'write'
+
 
 class EscPosXMLPrinter(DefaultXMLPrinter):
-    def __init__(self, printer):
+    # images are decoded in memory and given to the printer as a file object, set to False
+    # for escpos versions whose image() only accepts a file name
+    image_in_memory = True
+    # images are rasterized by xml_escpos.raster with numpy instead of the printer's image()
+    image_raster = raster.available()
+    image_dither = raster.DITHER_FLOYD_STEINBERG
+
+    def __init__(self, printer, image_cache=None):
+        """
+        printer is the escpos printer to print on. image_cache is an optional RasterCache
+        where the escpos bytes of printed images are kept, to print repeated images such
+        as logos without decoding and rasterizing them again.
+        """
         self.printer = printer
-        self.printer.charcode("MULTILINGUAL")
+        self.image_cache = image_cache
+        try:
+            self.printer.charcode("MULTILINGUAL")
+        except KeyError:
+            # python-escpos 3 names code pages after their encoding, and by default
+            # switches to the code page of each character, which covers MULTILINGUAL
+            pass
         super(EscPosXMLPrinter, self).__init__(printer)
         self.cmds = {
             # translation from styles to escpos commands
@@ -545,6 +972,9 @@ class EscPosXMLPrinter(DefaultXMLPrinter):
                 '_order': 1,
             },
         }
+        self.cmds_order = sorted(self.cmds, key=lambda style: self.cmds[style]['_order'])
+        self.escpos_cache = {}
+        self.style_state = None
 
     def set_sheet_slip_mode(self):
         self.printer._raw(SHEET_SLIP_MODE)
@@ -552,41 +982,282 @@ class EscPosXMLPrinter(DefaultXMLPrinter):
     def set_sheet_roll_mode(self):
         self.printer._raw(SHEET_ROLL_MODE)
 
+    def raw_output(self):
+        return self.printer, '_raw'
+
     def apply_style(self, stylestack):
-        self.printer._raw(self.to_escpos(stylestack))
+        cmd = self.to_escpos(stylestack)
+        if cmd:
+            self.printer._raw(cmd)
+
+    def reset_style(self):
+        self.style_state = None
+
+    def render_key(self):
+        return self.__class__, self.image_settings()
+
+    def forget_device_state(self):
+        self.reset_style()
+        magic = getattr(self.printer, 'magic', None)  # the code page encoder of python-escpos 3
+        if magic is not None:
+            forced = magic.disabled and magic.encoding
+            magic.encoding = None
+            if forced:
+                magic.force_encoding(forced)
+
+    def device_state(self):
+        magic = getattr(self.printer, 'magic', None)
+        return magic.encoding if magic is not None else None
+
+    def set_device_state(self, state):
+        self.reset_style()
+        magic = getattr(self.printer, 'magic', None)
+        if magic is not None:
+            magic.encoding = state
 
     def to_escpos(self, stylestack):
-        """ converts the current style to an escpos command string """
-        cmd = ''
-        ordered_cmds = self.cmds.keys()
-        ordered_cmds.sort(lambda x, y: cmp(self.cmds[x]['_order'], self.cmds[y]['_order']))
-        for style in ordered_cmds:
-            cmd += self.cmds[style][stylestack.get(style)]
+        """
+        converts the current style to an escpos command string. Only the styles that differ
+        from the ones the device is already in are sent.
+        """
+        state = self.style_state
+        style = tuple([stylestack.get(name) for name in self.cmds_order])
+        try:
+            cmd = self.escpos_cache[state, style]
+        except KeyError:
+            cmd = self.escpos_cache[state, style] = self._escpos_delta(state, style)
+        self.style_state = style
         return cmd
 
+    def _escpos_delta(self, state, style):
+        """ builds the command string changing the device from the state style tuple to the style tuple """
+        cmds = []
+        size_sent = False
+        for i, name in enumerate(self.cmds_order):
+            value = style[i]
+            # ESC ! resets the styles ordered after it, they are sent again
+            if state is None or state[i] != value or (size_sent and self.cmds[name]['_order'] > 1):
+                cmds.append(self.cmds[name][value])
+                if name == 'size':
+                    size_sent = True
+        return b''.join(cmds)
+
     def text(self, text):
         self.printer.text(text)
 
     def barcode(self, code, encoding, **kwargs):
         self.printer.barcode(code, encoding, **kwargs)
+        self.reset_style()
 
     def qr(self, content, **kwargs):
         self.printer.qr(content, **kwargs)
+        self.reset_style()
 
-    def cut(self):
-        self.printer.cut()
+    def cut(self, mode='full'):
+        self.printer.cut(mode=mode)
 
     def close(self):
         self.printer.close()
 
     def print_base64_image(self, img_src):
-        temp_file = tempfile.NamedTemporaryFile()
+        if self.image_cache is None:
+            self._print_image(img_src)
+        else:
+            key = (self.image_cache.key(img_src), self.image_settings())
+            data = self.image_cache.get(key)
+            if data is not None:
+                self.printer._raw(data)
+            else:
+                with self.buffered() as output:
+                    self._print_image(img_src)
+                    data = bytes(output.data)
+                self.image_cache.put(key, data)
+        self.reset_style()
+
+    def _print_image(self, img_src):
+        if self.image_raster:
+            data = raster.image_to_raster(base64.b64decode(img_src), self.image_width(), self.image_dither)
+            self.printer._raw(data)
+        elif self.image_in_memory:
+            self.printer.image(io.BytesIO(base64.b64decode(img_src)))
+        else:
+            temp_file = tempfile.NamedTemporaryFile()
+            try:
+                open(temp_file.name, 'wb').write(base64.b64decode(img_src))
+                self.printer.image(temp_file.name)
+            finally:
+                temp_file.close()
+
+    def image_settings(self):
+        """ the printer settings the escpos bytes of an image depend on, part of the image cache key """
+        return self.image_width(), self.image_raster and self.image_dither
+
+    def image_width(self):
+        """ the printable width in dots from the printer profile, None if unknown """
         try:
-            open(temp_file.name, 'wb').write(base64.b64decode(img_src))
-            self.printer.image(temp_file.name)
-        finally:
-            temp_file.close()
+            return int(self.printer.profile.profile_data['media']['width']['pixels'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
 
     def cashdraw(self):
         self.printer.cashdraw(2)
         self.printer.cashdraw(5)
+
+
+OP_TEXT = 'text'
+OP_STYLE = 'style'
+OP_BARCODE = 'barcode'
+OP_QR = 'qr'
+OP_IMAGE = 'image'
+OP_CUT = 'cut'
+OP_CASHDRAW = 'cashdraw'
+OP_SLIP = 'slip'
+
+
+class ResolvedStyle(object):
+    """
+    A frozen copy of the escpos styles of a stylestack. It can be given to the
+    printers apply_style() in place of a StyleStack.
+    """
+    __slots__ = ('styles',)
+
+    def __init__(self, styles):
+        self.styles = styles
+
+    def get(self, style):
+        return self.styles.get(style)
+
+    def get_styles(self):
+        return self.styles
+
+
+def _exec_text(printer, text):
+    printer.text(text)
+
+
+def _exec_style(printer, style):
+    printer.apply_style(style)
+
+
+def _exec_barcode(printer, code, encoding, kwargs):
+    printer.barcode(code, encoding, **kwargs)
+
+
+def _exec_qr(printer, content, kwargs):
+    printer.qr(content, **kwargs)
+
+
+def _exec_image(printer, img_src):
+    printer.print_base64_image(img_src)
+
+
+def _exec_cut(printer, mode):
+    if mode is None:
+        printer.cut()
+    else:
+        printer.cut(mode=mode)
+
+
+def _exec_cashdraw(printer):
+    printer.cashdraw()
+
+
+def _exec_slip(printer):
+    printer.set_sheet_slip_mode()
+    printer.slip_sheet_mode = True
+
+
+_OP_EXECUTORS = {
+    OP_TEXT: _exec_text,
+    OP_STYLE: _exec_style,
+    OP_BARCODE: _exec_barcode,
+    OP_QR: _exec_qr,
+    OP_IMAGE: _exec_image,
+    OP_CUT: _exec_cut,
+    OP_CASHDRAW: _exec_cashdraw,
+    OP_SLIP: _exec_slip,
+}
+
+
+class ReceiptProgram(object):
+    """
+    A receipt compiled to a flat list of printer operations. Each operation is a tuple
+    (opcode, args...) where styles, lines and values are already resolved, so executing
+    a program does no xml parsing, style computation or tag dispatch.
+    """
+
+    def __init__(self, ops=None):
+        self.ops = ops if ops is not None else []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def execute(self, printer):
+        """ prints the compiled receipt on an EscPosXMLPrinter, DarumaXMLPrinter, ... """
+        executors = _OP_EXECUTORS
+        printer.reset_style()
+        for op in self.ops:
+            executors[op[0]](printer, *op[1:])
+
+
+class _ProgramBuilder(DefaultXMLPrinter):
+    """ A printer that records what receipt() prints as a ReceiptProgram """
+
+    def __init__(self):
+        super(_ProgramBuilder, self).__init__(None)
+        self.ops = []
+        self.pending_text = []
+
+    def _op(self, *op):
+        self._flush_text()
+        self.ops.append(op)
+
+    def _flush_text(self):
+        if self.pending_text:
+            self.ops.append((OP_TEXT, ''.join(self.pending_text)))
+            self.pending_text = []
+
+    def set_sheet_slip_mode(self):
+        self._op(OP_SLIP)
+
+    def apply_style(self, stylestack):
+        style = ResolvedStyle(stylestack.get_styles())
+        self._flush_text()
+        if self.ops and self.ops[-1][0] == OP_STYLE:
+            # nothing was printed with the previous style
+            self.ops[-1] = (OP_STYLE, style)
+        else:
+            self.ops.append((OP_STYLE, style))
+
+    def text(self, text):
+        self.pending_text.append(text)
+
+    def barcode(self, code, encoding, **kwargs):
+        self._op(OP_BARCODE, code, encoding, kwargs)
+
+    def qr(self, content, **kwargs):
+        self._op(OP_QR, content, kwargs)
+
+    def print_base64_image(self, img_src):
+        self._op(OP_IMAGE, img_src)
+
+    def cut(self, mode=None):
+        # a full cut is replayed as cut(), like CutHandler calls it
+        self._op(OP_CUT, mode)
+
+    def cashdraw(self):
+        self._op(OP_CASHDRAW)
+
+    def program(self):
+        self._flush_text()
+        return ReceiptProgram(self.ops)
+
+
+def compile_receipt(xml):
+    """
+    Compiles an xml based receipt definition to a ReceiptProgram that can be
+    printed repeatedly with ReceiptProgram.execute(printer)
+    """
+    builder = _ProgramBuilder()
+    receipt(builder, xml)
+    return builder.program()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Printing from asyncio (python 3). Receipts are rendered in the event loop, which is fast
+as the rendering does no I/O, then written to the printer with awaited drains, so one
+process can drive many network printers concurrently:
+
+    async def print_order(host, xml):
+        async with AsyncNetwork(host) as device:
+            await receipt_async(EscPosXMLPrinter(device), xml)
+
+    await asyncio.gather(*[print_order(host, xml) for host in kitchen_printers])
+"""
+
+import asyncio
+
+from escpos.escpos import Escpos
+
+from xml_escpos import receipt
+
+
+class AsyncNetwork(Escpos):
+    """
+    A python-escpos printer on an asyncio stream to a network printer. The writes made
+    before open() are sent once connected.
+    """
+
+    def __init__(self, host, port=9100, timeout=60, **kwargs):
+        Escpos.__init__(self, **kwargs)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.pending = bytearray()
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        if self.pending:
+            self.writer.write(bytes(self.pending))
+            self.pending = bytearray()
+            await self.drain()
+
+    def _raw(self, msg):
+        if not isinstance(msg, (bytes, bytearray)):
+            msg = msg.encode('utf-8')
+        if self.writer is None:
+            self.pending.extend(msg)
+        else:
+            self.writer.write(msg)
+
+    async def drain(self):
+        """ waits until the written data has been handed to the network """
+        if self.writer is not None:
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def aclose(self):
+        if self.writer is not None:
+            writer, self.writer, self.reader = self.writer, None, None
+            writer.close()
+            if hasattr(writer, 'wait_closed'):
+                await writer.wait_closed()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+async def receipt_async(printer, xml, cache=None, flush_policy=None, profile=None):
+    """
+    Prints an xml based receipt definition like receipt(), from a coroutine. The receipt
+    is rendered in memory, then written in the chunks of the FlushPolicy; when the
+    printer output has a drain() coroutine, as AsyncNetwork, each chunk is awaited.
+    """
+    output, method = printer.raw_output()
+    chunks = []
+    with printer.redirected(chunks.append) as device_write:
+        receipt(printer, xml, cache=cache, buffered=True, flush_policy=flush_policy, profile=profile)
+    drain = getattr(output, 'drain', None)
+    for chunk in chunks:
+        device_write(chunk)
+        if drain is not None:
+            await drain()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Load balancing receipts over a group of interchangeable printers. Each job goes to the
+printer whose queue will be empty first, estimated from the text bytes and image rows of
+the jobs it has to print and its speed. A job failing on a printer with an I/O error is
+printed on another one, and the failing printer is avoided for a while.
+
+    spooler = Spooler()
+    for name in ('counter-1', 'counter-2', 'counter-3'):
+        spooler.add_printer(name, printers[name])
+    balancer = LoadBalancer(spooler, ['counter-1', 'counter-2', 'counter-3'])
+    job = balancer.submit(xml)
+    job.wait(10)
+    job.printer_name
+"""
+
+import base64
+import binascii
+import re
+import struct
+import threading
+import time
+
+from xml_escpos.spooler import PrintJob, JOB_PRINTING, JOB_DONE, JOB_FAILED
+
+IMG_SRC = re.compile(r'<img\b[^>]*\bsrc\s*=\s*["\']([^"\']*)["\']')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_size(src):
+    """ the (width, height) of a base64 png from its header, None if it is not a png """
+    try:
+        header = base64.b64decode(src[:32])
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE):
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def estimate_work(xml):
+    """
+    estimates the work of printing a receipt without rendering it: returns the bytes of
+    its xml besides its images, and the (width, height) of its png images
+    """
+    text = len(xml)
+    images = []
+    for match in IMG_SRC.finditer(xml):
+        text -= len(match.group(1))
+        size = png_size(match.group(1))
+        if size is not None:
+            images.append(size)
+    return text, images
+
+
+class PrinterSpeed(object):
+    """
+    How fast a printer prints: bytes_per_second of text, rows_per_second of images, for
+    images dots wide at most, wider images being scaled down.
+    """
+
+    def __init__(self, bytes_per_second=3000, rows_per_second=1500, dots=512):
+        self.bytes_per_second = bytes_per_second
+        self.rows_per_second = rows_per_second
+        self.dots = dots
+
+    def seconds(self, work):
+        """ the estimated time to print the work returned by estimate_work() """
+        text, images = work
+        rows = sum(height * min(1.0, float(self.dots) / width) for width, height in images if width)
+        return text / float(self.bytes_per_second) + rows / float(self.rows_per_second)
+
+
+class BalancedJob(PrintJob):
+    """
+    The handle of a load balanced job; printer_name is the printer of its last attempt. The
+    job is printing from the start of its first attempt until it is printed or has failed
+    on its last attempt.
+    """
+
+    def __init__(self, xml, options):
+        super(BalancedJob, self).__init__(None, xml, options)
+        self.attempts = []  # the PrintJobs of the printers tried
+
+    def cancel(self):
+        if self.attempts and not self.attempts[-1].cancel():
+            return False
+        return super(BalancedJob, self).cancel()
+
+
+class LoadBalancer(object):
+    """
+    Dispatches jobs to the printers of a Spooler. printers is a list of printer names, or
+    a dict of printer name -> PrinterSpeed. Printers that are not ready according to their
+    StatusMonitor, and printers which failed less than cooldown seconds ago, are only used
+    if no other printer is available. A job is tried on at most max_attempts printers.
+    """
+
+    def __init__(self, spooler, printers, cooldown=30.0, max_attempts=3):
+        self.spooler = spooler
+        if not isinstance(printers, dict):
+            printers = dict((name, PrinterSpeed()) for name in printers)
+        self.speeds = printers
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.queued = dict((name, {}) for name in printers)  # name -> {PrintJob: estimated seconds}
+        self.failed_at = {}  # name -> time.time() of its last failure
+
+    def drain_time(self, name):
+        """ the estimated seconds until the printer has printed the jobs given to it """
+        now = time.time()
+        with self.lock:
+            jobs = list(self.queued[name].items())
+        total = 0.0
+        for job, seconds in jobs:
+            if job.started is not None:
+                seconds -= now - job.started
+            total += max(0.0, seconds)
+        return total
+
+    def available(self, name):
+        failed_at = self.failed_at.get(name)
+        return (self.spooler.ready(name) and
+                (failed_at is None or time.time() - failed_at >= self.cooldown))
+
+    def choose(self, work, exclude=()):
+        """ the printer that would print the work first, None if all are excluded """
+        candidates = [name for name in self.speeds if name not in exclude]
+        if not candidates:
+            return None
+        available = [name for name in candidates if self.available(name)]
+        return min(available or candidates,
+                   key=lambda name: self.drain_time(name) + self.speeds[name].seconds(work))
+
+    def submit(self, xml, **options):
+        """ queues a receipt on the least loaded printer, returns its BalancedJob """
+        job = BalancedJob(xml, options)
+        self._attempt(job, estimate_work(xml))
+        return job
+
+    def _attempt(self, job, work):
+        tried = [attempt.printer_name for attempt in job.attempts]
+        name = self.choose(work, tried)
+        attempt = self.spooler.submit(name, job.xml, **dict(job.options))
+        job.printer_name = name
+        job.attempts.append(attempt)
+        with self.lock:
+            self.queued[name][attempt] = self.speeds[name].seconds(work)
+        attempt.add_start_callback(lambda attempt: self._attempt_started(job, attempt))
+        attempt.add_done_callback(lambda attempt: self._attempt_done(job, attempt, work))
+
+    def _attempt_started(self, job, attempt):
+        if job._start():
+            job.started = attempt.started
+
+    def _attempt_done(self, job, attempt, work):
+        with self.lock:
+            self.queued[attempt.printer_name].pop(attempt, None)
+        if attempt.status == JOB_FAILED and isinstance(attempt.error, EnvironmentError):
+            self.failed_at[attempt.printer_name] = time.time()
+            if len(job.attempts) < min(self.max_attempts, len(self.speeds)):
+                try:
+                    self._attempt(job, work)
+                    return
+                except Exception:
+                    pass
+        if attempt.status in (JOB_DONE, JOB_FAILED) and job.status == JOB_PRINTING:
+            job._finish(attempt.error)
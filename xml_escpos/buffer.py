@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+
+class FlushPolicy(object):
+    """
+    Controls how a RenderBuffer writes its content to the device.
+
+    chunk_size: the maximum size of a single device write. None writes the whole
+        buffer in one call.
+    threshold: flush while still rendering as soon as that many bytes are buffered,
+        to bound the memory used by very long receipts. None only flushes at the end.
+    """
+
+    def __init__(self, chunk_size=None, threshold=None):
+        self.chunk_size = chunk_size
+        self.threshold = threshold
+
+
+class RenderBuffer(object):
+    """
+    Collects the raw output of a printer in memory and writes it to the device
+    in as few calls as the FlushPolicy allows.
+    """
+
+    def __init__(self, write, policy=None):
+        self.device_write = write
+        self.policy = policy or FlushPolicy()
+        self.data = bytearray()
+        self.written = 0
+        self.writes = 0
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode('utf-8')
+        self.data.extend(data)
+        threshold = self.policy.threshold
+        if threshold and len(self.data) >= threshold:
+            self.flush()
+
+    def flush(self):
+        """ writes the buffered bytes to the device """
+        data = self.data
+        if not data:
+            return
+        chunk_size = self.policy.chunk_size or len(data)
+        for start in range(0, len(data), chunk_size):
+            self.device_write(bytes(data[start:start + chunk_size]))
+            self.writes += 1
+        self.written += len(data)
+        self.data = bytearray()
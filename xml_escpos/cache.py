@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class _CacheEntry(object):
+    __slots__ = ('program', 'rendered', 'size')
+
+    def __init__(self, program, size):
+        self.program = program
+        self.rendered = {}
+        self.size = size
+
+
+class ReceiptCache(object):
+    """
+    A bounded, thread safe LRU cache of compiled receipts, keyed by a hash of the
+    receipt xml. Entries are evicted when there are more than max_entries of them
+    or when their total size goes over max_bytes. The size of an entry is the
+    length of its xml plus the length of the rendered bytes stored with it.
+
+    Give it to receipt() to skip parsing identical receipts:
+
+        cache = ReceiptCache()
+        receipt(printer, xml, cache=cache)
+    """
+
+    def __init__(self, max_entries=256, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.rendered_hits = 0
+        self.rendered_misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(xml):
+        """ the cache key of a receipt xml string """
+        if not isinstance(xml, bytes):
+            xml = xml.encode('utf-8')
+        return hashlib.sha1(xml).hexdigest()
+
+    def _lookup(self, key):
+        """ returns the entry and marks it as the most recently used. Must hold the lock. """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry
+        return entry
+
+    def _evict(self):
+        """ drops the least recently used entries until the cache is in bounds. Must hold the lock. """
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    def get_program(self, xml, key=None):
+        """ returns the compiled ReceiptProgram for the xml, compiling it on a miss """
+        from xml_escpos import compile_receipt
+
+        if key is None:
+            key = self.key(xml)
+        with self.lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.program
+            self.misses += 1
+
+        program = compile_receipt(xml)
+
+        with self.lock:
+            entry = self._lookup(key)
+            if entry is None:
+                entry = _CacheEntry(program, len(xml))
+                self.entries[key] = entry
+                self.size += entry.size
+                self._evict()
+            return entry.program
+
+    def get_rendered(self, key, render_key):
+        """ returns the (bytes, device state) stored by put_rendered() for render_key, or None """
+        with self.lock:
+            entry = self._lookup(key)
+            if entry is None or render_key not in entry.rendered:
+                self.rendered_misses += 1
+                return None
+            self.rendered_hits += 1
+            return entry.rendered[render_key]
+
+    def put_rendered(self, key, render_key, data, state=None):
+        """
+        stores the bytes a receipt renders to on printers with the render_key, and the
+        device state they leave the printer in
+        """
+        with self.lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return
+            old = entry.rendered.get(render_key)
+            if old is not None:
+                entry.size -= len(old[0])
+                self.size -= len(old[0])
+            entry.rendered[render_key] = (data, state)
+            entry.size += len(data)
+            self.size += len(data)
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """ returns the cache counters as a dictionnary """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rendered_hits': self.rendered_hits,
+                'rendered_misses': self.rendered_misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
+
+
+class RasterCache(object):
+    """
+    A bounded, thread safe LRU cache of the escpos bytes that images are printed with,
+    keyed by a hash of the base64 image source and the printer's image settings.
+    Entries are evicted when there are more than max_entries of them or when their
+    total size goes over max_bytes.
+
+        printer = EscPosXMLPrinter(Network('10.0.0.2'), image_cache=RasterCache())
+    """
+
+    def __init__(self, max_entries=64, max_bytes=4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(img_src):
+        """ the cache key of a base64 image source """
+        if not isinstance(img_src, bytes):
+            img_src = img_src.encode('ascii')
+        return hashlib.sha1(img_src).hexdigest()
+
+    def get(self, key):
+        """ returns the cached bytes, or None """
+        with self.lock:
+            data = self.entries.pop(key, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries[key] = data
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                key, data = self.entries.popitem(last=False)
+                self.size -= len(data)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """ returns the cache counters as a dictionnary """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Printing one receipt on several printers, e.g. a kitchen ticket on every station. The
+xml is parsed once and rendered once per printer render_key(), then the bytes are written
+to all the printers at the same time, each from its own thread.
+
+    results = receipt_fanout([grill, bar, expo], xml)
+    [(result.printer, result.latency, result.error) for result in results]
+"""
+
+import threading
+import xml.etree.ElementTree as ET
+from timeit import default_timer
+
+from xml_escpos import print_root
+
+
+class FanoutResult(object):
+    """
+    The outcome of a receipt on one printer. latency is the time from the start of the
+    fan-out to the last byte written, in seconds; error is the exception raised while
+    rendering or writing, None if the receipt was printed.
+    """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self.latency = None
+        self.bytes = 0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.latency is not None
+
+
+def render_bytes(printer, root, flush_policy=None):
+    """
+    renders a parsed receipt for the printer without writing it, from a forgotten device
+    state so that the bytes can be written to any printer with the same render_key().
+    Returns the device writes it would have made, in the chunks of the FlushPolicy, and
+    the device state they leave the printer in. The state of the printer is left as is.
+    """
+    chunks = []
+    state = printer.device_state()
+    with printer.redirected(chunks.append):
+        try:
+            with printer.buffered(flush_policy):
+                printer.forget_device_state()
+                print_root(printer, root)
+            rendered_state = printer.device_state()
+        finally:
+            printer.set_device_state(state)
+    return chunks, rendered_state
+
+
+def _write(printer, rendered, result, start):
+    chunks, state = rendered
+    try:
+        output, method = printer.raw_output()
+        device_write = getattr(output, method)
+        for chunk in chunks:
+            device_write(chunk)
+            result.bytes += len(chunk)
+        printer.set_device_state(state)
+        result.latency = default_timer() - start
+    except Exception as e:
+        result.error = e
+
+
+def receipt_fanout(printers, xml, flush_policy=None, timeout=None):
+    """
+    Prints an xml based receipt definition on each of the printers, returns a FanoutResult
+    per printer, in the same order. A failing printer does not stop the others. If timeout
+    is given, the printers still writing after timeout seconds are reported with an error,
+    their threads finishing in the background.
+    """
+    start = default_timer()
+    results = [FanoutResult(printer) for printer in printers]
+    root = ET.fromstring(xml.encode('utf-8'))
+
+    rendered = {}  # render key -> (chunks, device state), or the rendering exception
+    threads = []
+    for printer, result in zip(printers, results):
+        key = printer.render_key()
+        if key not in rendered:
+            try:
+                rendered[key] = render_bytes(printer, root, flush_policy)
+            except Exception as e:
+                rendered[key] = e
+        if isinstance(rendered[key], Exception):
+            result.error = rendered[key]
+            continue
+        thread = threading.Thread(target=_write, args=(printer, rendered[key], result, start))
+        thread.daemon = True
+        thread.start()
+        threads.append((thread, result))
+
+    deadline = None if timeout is None else start + timeout
+    for thread, result in threads:
+        thread.join(None if deadline is None else max(0.0, deadline - default_timer()))
+        if thread.is_alive():
+            result.error = RuntimeError('Printer still writing after %s seconds' % timeout)
+    return results
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Flow control of the output to printers with a small receive buffer, which drop the bytes
+they receive while the buffer is full. A FlowControlWriter sits between an xml printer
+and its device: it splits the output in chunks and, between chunks, waits until the
+printer is ready. The chunk size adapts to the throughput measured, so that fast
+printers get large chunks and slow ones small chunks.
+
+Status requests are real-time commands, which printers take as data inside another
+command: the writer only waits between commands and never splits a write.
+
+    with flow_controlled(printer, wait=realtime_status_wait(printer.printer._read)):
+        receipt(printer, xml)
+"""
+
+import time
+from contextlib import contextmanager
+from timeit import default_timer
+
+DLE_EOT_PRINTER = b'\x10\x04\x01'  # DLE EOT 1: transmit printer status, in real time
+STATUS_OFFLINE = 0x08
+
+# the xml printer methods each sending whole commands, between which the printer can wait
+COMMAND_METHODS = ('text', 'apply_style', 'barcode', 'qr', 'print_base64_image', 'cut', 'cashdraw',
+                   'set_sheet_slip_mode', 'set_sheet_roll_mode')
+
+
+class FlowControlWriter(object):
+    """
+    Writes to the device in chunks of about chunk_size bytes, calling wait() between
+    chunks. Writes are never split: wait() is called before a write that would make the
+    chunk larger than chunk_size, or after a write larger than chunk_size. wait(write) is
+    given the device write function, to send status requests, and returns whether the
+    printer is ready; when it is not, the chunk size is halved.
+
+    If marked, the writes are parts of commands, and wait() is only called at the command
+    boundaries marked with boundary(), as flow_controlled() does; otherwise each write is
+    taken as whole commands.
+
+    With adaptive and a wait function, the chunk size follows the throughput of the
+    printer, measured on each chunk written and waited for: it is set to the bytes the
+    printer takes in interval seconds, between min_chunk and max_chunk. max_chunk should
+    not be more than the size of the printer's receive buffer.
+    """
+
+    def __init__(self, write, chunk_size=256, wait=None, adaptive=True, min_chunk=32, max_chunk=4096,
+                 interval=0.1, smoothing=0.3, marked=False):
+        self.device_write = write
+        self.chunk_size = chunk_size
+        self.wait = wait
+        self.adaptive = adaptive
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.interval = interval
+        self.smoothing = smoothing
+        self.marked = marked
+        self.at_boundary = True
+        self.rate = None  # bytes per second, smoothed
+        self.pending = 0  # bytes written since the last wait
+        self.started = None  # time of the first write since the last wait
+        self.writes = 0
+        self.waits = 0
+        self.not_ready = 0
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode('utf-8')
+        if self.at_boundary and self.pending and self.pending + len(data) > self.chunk_size:
+            self.sync()
+        if self.started is None:
+            self.started = default_timer()
+        self.device_write(data)
+        self.writes += 1
+        self.pending += len(data)
+        if self.marked:
+            self.at_boundary = False
+        elif self.pending >= self.chunk_size:
+            self.sync()
+
+    def boundary(self):
+        """ marks the end of a command, where the printer can be waited for """
+        self.at_boundary = True
+        if self.pending >= self.chunk_size:
+            self.sync()
+
+    def sync(self):
+        """ waits for the printer to be ready for the next chunk """
+        if self.wait is not None:
+            self.waits += 1
+            ready = self.wait(self.device_write)
+            # without waiting, the time measured is the one of copying to the OS buffers
+            if self.started is not None and self.pending:
+                self._adapt(self.pending, default_timer() - self.started, ready)
+        self.pending = 0
+        self.started = None
+
+    def _adapt(self, size, elapsed, ready):
+        if not ready:
+            self.not_ready += 1
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+            return
+        if not self.adaptive or elapsed <= 0:
+            return
+        rate = size / elapsed
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate += self.smoothing * (rate - self.rate)
+        self.chunk_size = int(min(self.max_chunk, max(self.min_chunk, self.rate * self.interval)))
+
+    def stats(self):
+        return {'chunk_size': self.chunk_size, 'rate': self.rate, 'writes': self.writes, 'waits': self.waits,
+                'not_ready': self.not_ready}
+
+
+def realtime_status_wait(read, timeout=2.0, poll=0.05):
+    """
+    Returns a wait function for FlowControlWriter polling the printer with DLE EOT 1 until
+    it reports being online, at most timeout seconds. read() returns the bytes received
+    from the printer, as the _read() of python-escpos serial and network printers.
+    Printers go offline while their cover is open or they are out of paper, and many
+    while their buffer is full.
+    """
+    def wait(write):
+        deadline = default_timer() + timeout
+        while True:
+            write(DLE_EOT_PRINTER)
+            status = read()
+            if status and not ord(status[-1:]) & STATUS_OFFLINE:
+                return True
+            if default_timer() >= deadline:
+                return False
+            time.sleep(poll)
+    return wait
+
+
+@contextmanager
+def flow_controlled(printer, **kwargs):
+    """
+    Sends the raw output of an xml printer through a FlowControlWriter inside the with
+    block, kwargs being its options. Yields the writer. The printer is waited for between
+    the commands of its methods (text, barcode, image...). Receipts are to be printed
+    unbuffered: the output of a buffer is only written at its end, without waits.
+    """
+    output, method = printer.raw_output()
+    writer = FlowControlWriter(getattr(output, method), marked=True, **kwargs)
+    with printer.redirected(writer.write):
+        with _marked_commands(printer, writer):
+            yield writer
+
+
+@contextmanager
+def _marked_commands(printer, writer):
+    """ marks a command boundary before each call of the printer's command methods """
+    def marked(method):
+        def command(*args, **kwargs):
+            writer.boundary()
+            return method(*args, **kwargs)
+        return command
+
+    previous = dict((name, printer.__dict__.get(name)) for name in COMMAND_METHODS)
+    for name in COMMAND_METHODS:
+        setattr(printer, name, marked(getattr(printer, name)))
+    try:
+        yield
+    finally:
+        for name, method in previous.items():
+            if method is None:
+                delattr(printer, name)
+            else:
+                setattr(printer, name, method)
+    writer.boundary()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+A durable journal of print jobs in SQLite, so that the jobs of a process that dies
+before they are printed can be printed again on restart. Jobs are recorded before being
+rendered and marked done after their last byte is written, which makes printing at
+least once: a job interrupted after its last write but before being marked done is
+printed again.
+
+Writes are committed in batches, every batch_size writes or batch_interval seconds,
+whichever comes first, so a rush of jobs costs a few disk syncs instead of one per job.
+A job is then durable up to batch_interval seconds after it is recorded; commit() makes
+it durable at once.
+
+    journal = JobJournal('/var/spool/pos/jobs.db')
+    spooler = Spooler(journal=journal)
+    spooler.add_printer('kitchen', printer)
+    spooler.replay()  # prints the jobs left unfinished by the previous run
+"""
+
+import sqlite3
+import threading
+import time
+
+JOURNAL_QUEUED = 'queued'
+JOURNAL_PRINTING = 'printing'
+JOURNAL_DONE = 'done'
+JOURNAL_FAILED = 'failed'
+JOURNAL_CANCELLED = 'cancelled'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    printer TEXT NOT NULL,
+    xml TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+'''
+
+
+class JobJournal(object):
+    """ the job store, usable from several threads """
+
+    def __init__(self, path, batch_size=50, batch_interval=0.05):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # with WAL, NORMAL only syncs at checkpoints: commits survive a crash of the
+        # process, not a power loss, which is the price of cheap commits
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.lock = threading.RLock()
+        self.uncommitted = 0
+        self.timer = None
+
+    def _write(self, sql, args):
+        with self.lock:
+            cursor = self.db.execute(sql, args)
+            self.uncommitted += 1
+            if self.uncommitted >= self.batch_size:
+                self.commit()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.batch_interval, self.commit)
+                self.timer.daemon = True
+                self.timer.start()
+            return cursor
+
+    def commit(self):
+        """ makes the recorded changes durable """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.uncommitted:
+                self.db.commit()
+                self.uncommitted = 0
+
+    def add(self, printer_name, xml):
+        """ records a job to print, returns its id """
+        now = time.time()
+        return self._write('INSERT INTO jobs (printer, xml, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+                           (printer_name, xml, JOURNAL_QUEUED, now, now)).lastrowid
+
+    def _set_status(self, job_id, status, error=None):
+        self._write('UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?',
+                    (status, error, time.time(), job_id))
+
+    def start(self, job_id):
+        """ records that the job is being printed """
+        self._write('UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ? WHERE id = ?',
+                    (JOURNAL_PRINTING, time.time(), job_id))
+
+    def done(self, job_id):
+        self._set_status(job_id, JOURNAL_DONE)
+
+    def failed(self, job_id, error):
+        self._set_status(job_id, JOURNAL_FAILED, u'%r' % (error,))
+
+    def cancelled(self, job_id):
+        self._set_status(job_id, JOURNAL_CANCELLED)
+
+    def unfinished(self):
+        """ the (id, printer name, xml, attempts) of the jobs queued or being printed, oldest first """
+        with self.lock:
+            return self.db.execute('SELECT id, printer, xml, attempts FROM jobs WHERE status IN (?, ?) ORDER BY id',
+                                   (JOURNAL_QUEUED, JOURNAL_PRINTING)).fetchall()
+
+    def counts(self):
+        """ the number of jobs in each status """
+        with self.lock:
+            return dict(self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def purge(self, before=None):
+        """ deletes the jobs done or cancelled, or only those last updated before a time.time() """
+        sql = 'DELETE FROM jobs WHERE status IN (?, ?)'
+        args = (JOURNAL_DONE, JOURNAL_CANCELLED)
+        if before is not None:
+            sql += ' AND updated < ?'
+            args += (before,)
+        with self.lock:
+            deleted = self.db.execute(sql, args).rowcount
+            self.uncommitted += 1
+            self.commit()
+            return deleted
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.db.close()
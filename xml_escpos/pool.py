@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+A pool of open connections to network printers, keyed by host and port. Connections are
+kept open between jobs, checked before being reused, and reopened with an exponential
+backoff when the printer is unreachable. The xml printers made on a connection are kept
+with it, so their initialization commands (the character code table) are sent once per
+connection instead of once per job.
+
+    pool = PrinterPool()
+    with pool.printer('10.0.0.12') as printer:
+        receipt(printer, xml)
+"""
+
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from xml_escpos import EscPosXMLPrinter
+
+
+class PrinterUnavailable(IOError):
+    """ the printer cannot be connected to, or is waiting for its next connection attempt """
+
+
+def network_connect(host, port, timeout):
+    """ opens a python-escpos Network printer """
+    from escpos.printer import Network
+    printer = Network(host, port=port, timeout=timeout)
+    printer.device  # python-escpos 3 connects on first use
+    return printer
+
+
+def socket_alive(sock):
+    """
+    whether the peer has not closed the socket. Bytes sent by the printer, such as
+    automatic status back, mean it is still there.
+    """
+    try:
+        readable = select.select([sock], [], [], 0)[0]
+        return not readable or sock.recv(1, socket.MSG_PEEK) != b''
+    except (socket.error, ValueError):
+        return False
+
+
+class PooledConnection(object):
+    """ a connection of the pool, used by one job at a time """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.printer = None  # the escpos printer, None when disconnected
+        self.xml_printers = {}  # xml printer class -> xml printer on this connection
+        self.lock = threading.Lock()
+        self.failures = 0  # consecutive failed connection attempts
+        self.retry_at = 0.0
+        self.last_used = 0.0
+        self.connects = 0
+
+    def socket(self):
+        device = getattr(self.printer, 'device', None)
+        return device if hasattr(device, 'fileno') else None
+
+    def disconnect(self):
+        printer, self.printer = self.printer, None
+        self.xml_printers = {}
+        if printer is not None:
+            try:
+                printer.close()
+            except Exception:
+                pass
+
+
+class PrinterPool(object):
+    """
+    connect(host, port, timeout) opens the escpos printer of a connection, by default a
+    python-escpos Network printer. Connections idle for more than max_idle seconds are
+    reopened, as printers drop idle clients. After n failed connection attempts the next
+    one waits min(max_backoff, backoff * 2 ** (n - 1)) seconds.
+    """
+
+    def __init__(self, connect=network_connect, timeout=10, max_idle=None, backoff=0.5, max_backoff=30.0,
+                 xml_printer_class=EscPosXMLPrinter):
+        self.connect = connect
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.xml_printer_class = xml_printer_class
+        self.connections = {}  # 'host:port' -> PooledConnection
+        self.lock = threading.Lock()
+
+    def connection(self, host, port=9100):
+        key = '%s:%d' % (host, port)
+        with self.lock:
+            conn = self.connections.get(key)
+            if conn is None:
+                conn = self.connections[key] = PooledConnection(host, port)
+            return conn
+
+    @contextmanager
+    def printer(self, host, port=9100, xml_printer_class=None):
+        """
+        Yields an xml printer on the pooled connection to the printer, waiting for the
+        connection if another job is using it. Raises PrinterUnavailable if the printer
+        cannot be connected to. The connection is dropped if the job fails.
+        """
+        cls = xml_printer_class or self.xml_printer_class
+        conn = self.connection(host, port)
+        with conn.lock:
+            if conn.printer is not None and not self.healthy(conn):
+                conn.disconnect()
+            if conn.printer is None:
+                self._connect(conn)
+            printer = conn.xml_printers.get(cls)
+            if printer is None:
+                printer = conn.xml_printers[cls] = cls(conn.printer)
+            try:
+                yield printer
+            except Exception:
+                conn.disconnect()
+                raise
+            finally:
+                conn.last_used = time.time()
+
+    def healthy(self, conn):
+        if self.max_idle is not None and time.time() - conn.last_used > self.max_idle:
+            return False
+        sock = conn.socket()
+        return sock is None or socket_alive(sock)
+
+    def _connect(self, conn):
+        now = time.time()
+        if now < conn.retry_at:
+            raise PrinterUnavailable('%s:%d unreachable, next attempt in %.1fs'
+                                     % (conn.host, conn.port, conn.retry_at - now))
+        try:
+            conn.printer = self.connect(conn.host, conn.port, self.timeout)
+        except Exception as e:
+            conn.failures += 1
+            conn.retry_at = now + min(self.max_backoff, self.backoff * 2 ** (conn.failures - 1))
+            raise PrinterUnavailable('%s:%d unreachable: %s' % (conn.host, conn.port, e))
+        conn.failures = 0
+        conn.retry_at = 0.0
+        conn.connects += 1
+
+    def stats(self):
+        return dict((key, {'connected': conn.printer is not None, 'connects': conn.connects,
+                           'failures': conn.failures})
+                    for key, conn in self.connections.items())
+
+    def close(self):
+        """ closes all the connections """
+        with self.lock:
+            connections = list(self.connections.values())
+        for conn in connections:
+            with conn.lock:
+                conn.disconnect()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling of print jobs: where the time of a receipt goes (parsing, style resolution,
+each tag, each printer method) and how many bytes and device writes it produces.
+
+    profile = ReceiptProfile()
+    receipt(printer, xml, profile=profile)
+    profile.summary()
+
+    total = ReceiptProfile()
+    total.merge(profile)
+"""
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+
+class ReceiptProfile(object):
+    """
+    Timings and counters of one or more print jobs, in seconds. Profiles are added up
+    with merge(), to aggregate the profiles of several jobs.
+
+    phases: 'parse', 'style' (stylestack updates), 'cache' (compiled receipt lookup)
+    tags: time spent in the handler of each tag, not counting its children but counting
+        the printer calls it makes, the number of elements and the bytes they produced
+    methods: time, calls and bytes produced by each printer method
+    """
+
+    def __init__(self):
+        self.jobs = 0
+        self.wall = 0.0
+        self.bytes = 0
+        self.writes = 0
+        self.phases = {}  # name -> [seconds, count]
+        self.tags = {}  # tag -> [seconds, elements, bytes]
+        self.methods = {}  # name -> [seconds, calls, bytes]
+
+    def add_phase(self, name, seconds):
+        stat = self.phases.setdefault(name, [0.0, 0])
+        stat[0] += seconds
+        stat[1] += 1
+
+    def add_tag(self, tag, seconds, size, elements=1):
+        stat = self.tags.setdefault(tag, [0.0, 0, 0])
+        stat[0] += seconds
+        stat[1] += elements
+        stat[2] += size
+
+    def add_method(self, name, seconds, size):
+        stat = self.methods.setdefault(name, [0.0, 0, 0])
+        stat[0] += seconds
+        stat[1] += 1
+        stat[2] += size
+
+    def add_job(self, seconds, size, writes):
+        self.jobs += 1
+        self.wall += seconds
+        self.bytes += size
+        self.writes += writes
+
+    def merge(self, other):
+        """ adds the timings and counters of another profile to this one """
+        self.jobs += other.jobs
+        self.wall += other.wall
+        self.bytes += other.bytes
+        self.writes += other.writes
+        for mine, theirs in ((self.phases, other.phases), (self.tags, other.tags), (self.methods, other.methods)):
+            for key, stat in theirs.items():
+                if key in mine:
+                    mine[key] = [a + b for a, b in zip(mine[key], stat)]
+                else:
+                    mine[key] = list(stat)
+        return self
+
+    def summary(self):
+        """ returns the profile as a dictionnary of plain values """
+        return {
+            'jobs': self.jobs,
+            'wall': self.wall,
+            'bytes': self.bytes,
+            'writes': self.writes,
+            'phases': dict((name, {'time': stat[0], 'count': stat[1]})
+                           for name, stat in self.phases.items()),
+            'tags': dict((tag, {'time': stat[0], 'count': stat[1], 'bytes': stat[2]})
+                         for tag, stat in self.tags.items()),
+            'methods': dict((name, {'time': stat[0], 'calls': stat[1], 'bytes': stat[2]})
+                            for name, stat in self.methods.items()),
+        }
+
+
+class ProfiledPrinter(object):
+    """
+    Wraps an xml printer to record the time, calls and bytes of its methods in a
+    ReceiptProfile. Other attributes are those of the wrapped printer.
+    """
+    timed_methods = ('text', 'apply_style', 'barcode', 'qr', 'print_base64_image', 'cut', 'cashdraw',
+                     'set_sheet_slip_mode', 'set_sheet_roll_mode')
+
+    def __init__(self, printer, profile):
+        self.__dict__.update(printer=printer, profile=profile, bytes=0, writes=0, buffer=None, device_write=None)
+
+    def __getattr__(self, name):
+        attr = getattr(self.printer, name)
+        if name in self.timed_methods:
+            return self._timed(name, attr)
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self.printer, name, value)
+
+    def _timed(self, name, method):
+        profile = self.profile
+
+        def timed(*args, **kwargs):
+            size = self.emitted()
+            start = default_timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profile.add_method(name, default_timer() - start, self.emitted() - size)
+        return timed
+
+    def emitted(self):
+        """ the bytes produced so far, including the ones still buffered """
+        if self.buffer is not None:
+            return self.bytes + len(self.buffer.data)
+        return self.bytes
+
+    def _count(self, data):
+        self.__dict__['bytes'] += len(data)
+        self.__dict__['writes'] += 1
+        self.device_write(data)
+
+    @contextmanager
+    def job(self):
+        """ profiles the print job run inside the with block """
+        start = default_timer()
+        with self.printer.redirected(self._count) as device_write:
+            self.__dict__['device_write'] = device_write
+            try:
+                yield self
+            finally:
+                self.profile.add_job(default_timer() - start, self.bytes, self.writes)
+
+    @contextmanager
+    def buffered(self, policy=None):
+        with self.printer.buffered(policy) as buf:
+            previous = self.buffer
+            self.__dict__['buffer'] = buf
+            try:
+                yield buf
+            finally:
+                self.__dict__['buffer'] = previous
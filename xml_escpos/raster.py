@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion of images to ESC/POS raster graphics (GS v 0), vectorized with numpy.
+"""
+
+import io
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+GS_RASTER = b'\x1d\x76\x30'  # GS v 0
+RASTER_NORMAL = b'\x00'
+
+DITHER_THRESHOLD = 'threshold'
+DITHER_ORDERED = 'ordered'
+DITHER_FLOYD_STEINBERG = 'floyd-steinberg'
+
+BAYER_4X4 = [
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+]
+
+
+def available():
+    """ whether numpy and PIL are installed """
+    return numpy is not None and Image is not None
+
+
+def load_image(data):
+    """ opens the image from its encoded bytes """
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def to_grayscale(img, max_width=None):
+    """
+    converts a PIL image to a grayscale ('L') image, with transparent areas painted white,
+    and scales it down to max_width pixels if it is wider
+    """
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        background.paste(img, mask=img.split()[3])
+        img = background
+    img = img.convert('L')
+    if max_width and img.size[0] > max_width:
+        height = max(1, int(round(img.size[1] * float(max_width) / img.size[0])))
+        img = img.resize((max_width, height), Image.LANCZOS)
+    return img
+
+
+def to_bits(img, dither=DITHER_FLOYD_STEINBERG, threshold=128):
+    """
+    converts a grayscale PIL image to a boolean numpy array, True for the dots to print.
+    Floyd-Steinberg error diffusion is sequential along the rows, it is done by PIL's
+    C implementation. Threshold and ordered dithering are done on the whole array at once.
+    """
+    if dither == DITHER_FLOYD_STEINBERG:
+        return numpy.asarray(img.convert('1'), dtype=numpy.uint8) == 0
+
+    gray = numpy.asarray(img, dtype=numpy.uint8)
+    if dither == DITHER_THRESHOLD:
+        return gray < threshold
+    elif dither == DITHER_ORDERED:
+        height, width = gray.shape
+        bayer = (numpy.array(BAYER_4X4, dtype=numpy.float32) + 0.5) * (256.0 / 16)
+        reps = ((height + 3) // 4, (width + 3) // 4)
+        return gray < numpy.tile(bayer, reps)[:height, :width]
+    else:
+        raise ValueError('Unknown dither method: %s' % dither)
+
+
+def pack_raster(bits, fragment_height=960):
+    """
+    packs a boolean array of dots into GS v 0 commands, one command per fragment_height
+    rows as printers limit the height of a single raster image
+    """
+    packed = numpy.packbits(bits, axis=1)
+    width_bytes = packed.shape[1]
+    cmds = []
+    for top in range(0, packed.shape[0], fragment_height):
+        band = packed[top:top + fragment_height]
+        cmds.append(GS_RASTER + RASTER_NORMAL + struct.pack('<HH', width_bytes, band.shape[0]))
+        cmds.append(band.tobytes())
+    return b''.join(cmds)
+
+
+def image_to_raster(data, max_width=None, dither=DITHER_FLOYD_STEINBERG, threshold=128, fragment_height=960):
+    """ converts encoded image bytes to the escpos commands printing it """
+    img = to_grayscale(load_image(data), max_width)
+    return pack_raster(to_bits(img, dither, threshold), fragment_height)
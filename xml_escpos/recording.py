@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in printers and devices that record what would be sent to the printer, to test
+and benchmark receipts without hardware.
+
+    device = RecordingDevice(baudrate=38400, buffer_size=4096, print_rate=2000)
+    printer = EscPosXMLPrinter(RecordingPrinter(device))
+    receipt(printer, xml)
+    device.data, device.writes, device.stats()['time_to_last_byte']
+"""
+
+import time
+from escpos.escpos import Escpos
+
+
+class RecordingDevice(object):
+    """
+    A device recording every write. It can simulate the link to the printer and the
+    printer's receive buffer on a virtual clock:
+
+    baudrate: serial speed in bits per second (10 bits per byte on the wire).
+    bandwidth: link speed in bytes per second, e.g. for a network printer. Ignored if baudrate is given.
+    latency: fixed cost of each write, in seconds.
+    buffer_size: size of the printer receive buffer in bytes, None for unlimited.
+    print_rate: bytes per second the printer takes out of its buffer.
+    flow_control: when the buffer is full, the link waits for the printer (True) or the
+        bytes that don't fit are dropped (False), as with printers without handshaking.
+    realtime: write() sleeps for the simulated duration, so that wall clock measures
+        include the transmission time.
+
+    Without any of these the device is infinitely fast.
+    """
+
+    def __init__(self, baudrate=None, bandwidth=None, latency=0.0, buffer_size=None, print_rate=None,
+                 flow_control=True, realtime=False):
+        if baudrate:
+            bandwidth = baudrate / 10.0
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.buffer_size = buffer_size
+        self.print_rate = print_rate
+        self.flow_control = flow_control
+        self.realtime = realtime
+        self.reset()
+
+    def reset(self):
+        """ forgets the recorded writes and restarts the virtual clock """
+        self.data = bytearray()
+        self.write_sizes = []
+        self.clock = 0.0  # virtual time of the end of the last write
+        self.level = 0.0  # bytes in the printer buffer at self.clock
+        self.dropped = 0
+
+    @property
+    def writes(self):
+        return len(self.write_sizes)
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode('utf-8')
+        self.data.extend(data)
+        self.write_sizes.append(len(data))
+        duration = self._transmit(len(data))
+        if self.realtime and duration > 0:
+            time.sleep(duration)
+        return len(data)
+
+    def _transmit(self, size):
+        """ advances the virtual clock by the time needed to send size bytes, returns that time """
+        start = self.clock
+        if self.latency:
+            self._elapse(self.latency)
+        if self.bandwidth:
+            self._send(size, float(self.bandwidth))
+        else:
+            self._fill(size)
+        return self.clock - start
+
+    def _elapse(self, duration):
+        """ advances the clock while the printer empties its buffer """
+        self.clock += duration
+        if self.print_rate:
+            self.level = max(0.0, self.level - self.print_rate * duration)
+        else:
+            self.level = 0.0
+
+    def _fill(self, size):
+        """ puts size bytes in the printer buffer at once """
+        if not self.print_rate:
+            return
+        self.level += size
+        if self.buffer_size is not None and self.level > self.buffer_size:
+            excess = self.level - self.buffer_size
+            self.level = float(self.buffer_size)
+            if self.flow_control:
+                self.clock += excess / self.print_rate
+            else:
+                self.dropped += int(round(excess))
+
+    def _send(self, size, rate):
+        """ sends size bytes over the link at rate bytes per second """
+        if not self.print_rate or rate <= self.print_rate:
+            self._elapse(size / rate)
+            return
+        # the buffer fills at rate - print_rate until it is full, then the link either
+        # slows down to the print rate or the bytes that don't fit are lost
+        if self.buffer_size is None:
+            until_full = float('inf')
+        else:
+            until_full = (self.buffer_size - self.level) / (rate - self.print_rate)
+        if size <= rate * until_full:
+            duration = size / rate
+            self.clock += duration
+            self.level += (rate - self.print_rate) * duration
+            return
+        self.clock += until_full
+        self.level = float(self.buffer_size)
+        rest = size - rate * until_full
+        if self.flow_control:
+            self.clock += rest / self.print_rate
+        else:
+            self.clock += rest / rate
+            self.dropped += int(round(rest * (1 - self.print_rate / rate)))
+
+    def stats(self):
+        """
+        time_to_last_byte is the virtual time at which the last byte was sent, time_to_print
+        the time at which the printer has processed it, both in seconds from reset()
+        """
+        time_to_print = self.clock
+        if self.print_rate:
+            time_to_print += self.level / float(self.print_rate)
+        return {
+            'bytes': len(self.data),
+            'writes': self.writes,
+            'max_write': max(self.write_sizes) if self.write_sizes else 0,
+            'dropped': self.dropped,
+            'time_to_last_byte': self.clock,
+            'time_to_print': time_to_print,
+        }
+
+    def close(self):
+        pass
+
+
+class RecordingPrinter(Escpos):
+    """
+    A python-escpos printer that writes to a RecordingDevice, for EscPosXMLPrinter. The
+    recorded bytes are the ones python-escpos generates for a real printer.
+    """
+
+    def __init__(self, device=None, **kwargs):
+        Escpos.__init__(self, **kwargs)
+        self.device = device if device is not None else RecordingDevice()
+
+    def _raw(self, msg):
+        self.device.write(msg)
+
+    def close(self):
+        pass
+
+
+class RecordingDarumaPrinter(object):
+    """
+    A stand-in for the Daruma driver used by DarumaXMLPrinter. Text and raw writes go to
+    the RecordingDevice; the driver's mode and barcode calls are recorded in calls, as
+    (method name, arguments) tuples, since their bytes belong to the driver.
+    """
+
+    def __init__(self, device=None):
+        self.device = device if device is not None else RecordingDevice()
+        self.calls = []
+
+    def _call(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+
+    def textout(self, text):
+        self._call('textout', text)
+        self.device.write(text)
+
+    def text(self, text):
+        self._call('text', text)
+        self.device.write(text)
+
+    def justify_center(self):
+        self._call('justify_center')
+
+    def set_emphasized(self, on):
+        self._call('set_emphasized', on)
+
+    def set_condensed(self, on):
+        self._call('set_condensed', on)
+
+    def set_expanded(self, on):
+        self._call('set_expanded', on)
+
+    def ean13(self, code, **kwargs):
+        self._call('ean13', code, **kwargs)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Resuming a receipt that failed while printing, e.g. on paper out, from the last block
+written instead of from the start. The progress of the receipt is checkpointed after
+each block (paragraph, line, hr...) whose bytes the printer's device has accepted.
+On resume the receipt is rendered again with the output discarded up to that block, so
+that the styles in effect are the same, then a "continued" marker is printed and the
+receipt goes on.
+
+    progress = ReceiptProgress()
+    while not progress.done:
+        try:
+            receipt_resumable(printer, xml, progress)
+        except IOError:
+            wait_for_paper()
+"""
+
+import xml.etree.ElementTree as ET
+
+from xml_escpos import (StyleStack, XmlSerializer, print_elem, start_receipt, end_receipt)
+
+CONTINUED_MARKER = u'<p align="center" bold="on">- continued -</p>'
+
+
+class ReceiptProgress(object):
+    """
+    How far a receipt got. blocks is the number of blocks fully written to the device,
+    attempts the number of times printing was started, done whether it was completed.
+    """
+
+    def __init__(self):
+        self.blocks = 0
+        self.attempts = 0
+        self.done = False
+
+
+class _OutputGate(object):
+    """ forwards the raw output of the printer to the device once opened """
+
+    def __init__(self, device_write, opened):
+        self.device_write = device_write
+        self.opened = opened
+
+    def write(self, data):
+        if self.opened:
+            self.device_write(data)
+
+
+def print_marker(printer, marker):
+    """ prints the marker xml in the default styles """
+    printer.reset_style()
+    root = ET.fromstring(marker.encode('utf-8'))
+    print_elem(printer, StyleStack(), XmlSerializer(printer), root)
+    printer.reset_style()
+
+
+def receipt_resumable(printer, xml, progress, marker=CONTINUED_MARKER):
+    """
+    Prints an xml based receipt definition unbuffered, recording its progress in a
+    ReceiptProgress. If the progress has blocks, printing resumes after them, and the
+    marker xml is printed first, unless it is None. The root element attributes (sheet
+    mode, cut) are applied on every attempt.
+    """
+    if progress.done:
+        return
+    progress.attempts += 1
+    skip = progress.blocks
+    root = ET.fromstring(xml.encode('utf-8'))
+
+    if progress.attempts > 1:
+        # the failed attempt left the device in a style and code page the printer does not know
+        printer.forget_device_state()
+    else:
+        printer.reset_style()
+    start_receipt(printer, root)
+    output, method = printer.raw_output()
+    gate = _OutputGate(getattr(output, method), skip == 0)
+
+    def checkpoint(blocks):
+        if gate.opened:
+            progress.blocks = blocks
+        elif blocks == skip:
+            gate.opened = True
+            printer.forget_device_state()
+            if marker is not None:
+                print_marker(printer, marker)
+
+    with printer.redirected(gate.write):
+        print_elem(printer, StyleStack(), XmlSerializer(printer, checkpoint), root)
+    end_receipt(printer, root)
+    progress.done = True
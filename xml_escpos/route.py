@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Routing the sections of one receipt document to several printers. The children of the
+receipt element with a printer attribute are printed on the printers it names; the
+other children, such as the order number or a footer, are printed on every printer
+receiving a section:
+
+    <receipt>
+        <h1>Order 42</h1>
+        <section printer="grill">2 x Burger</section>
+        <section printer="bar, expo">1 x Lemonade</section>
+    </receipt>
+
+    receipt_routed({'grill': grill, 'bar': bar, 'expo': expo}, xml)
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+from xml_escpos import print_root
+
+ROUTE_ATTRIBUTE = 'printer'
+
+
+def route_names(elem):
+    """ the printer names of an element's printer attribute, empty if it is not routed """
+    return [name for name in re.split(r'[\s,]+', elem.attrib.get(ROUTE_ATTRIBUTE, '')) if name]
+
+
+def route_receipt(root, names, default=None):
+    """
+    Splits a parsed receipt into one receipt per printer, returns an OrderedDict of printer
+    name -> receipt root. The receipts share the elements of the original tree, nothing is
+    copied. Sections routed to a printer that is not in names go to the default printer,
+    a KeyError is raised if there is none. A document without routed sections is printed
+    on the default printer, a ValueError is raised if there is none.
+    """
+    children = list(root)
+    routes = []  # the printer names of each child, None for shared children
+    targets = []
+    for child in children:
+        routed = []
+        for name in route_names(child):
+            if name not in names:
+                if default is None:
+                    raise KeyError('Unknown printer: %s' % name)
+                name = default
+            if name not in routed:
+                routed.append(name)
+        routes.append(routed or None)
+        targets.extend(name for name in routed if name not in targets)
+    if not targets:
+        if default is None:
+            raise ValueError('No section of the receipt is routed to a printer and there is no default printer')
+        targets.append(default)
+
+    receipts = OrderedDict()
+    for name in targets:
+        part = ET.Element(root.tag, root.attrib)
+        part.text = root.text
+        part.extend(child for child, routed in zip(children, routes) if routed is None or name in routed)
+        receipts[name] = part
+    return receipts
+
+
+def receipt_routed(printers, xml, default=None, buffered=True, flush_policy=None):
+    """
+    Prints the sections of an xml based receipt definition on their printers, printers
+    being a dict of name -> xml printer. The document is parsed once; each printer gets a
+    receipt of its sections and the shared elements, rendered in its own buffer if
+    buffered. Returns the names of the printers printed on.
+    """
+    root = ET.fromstring(xml.encode('utf-8'))
+    receipts = route_receipt(root, printers, default)
+    for name, part in receipts.items():
+        printer = printers[name]
+        if buffered:
+            with printer.buffered(flush_policy):
+                print_root(printer, part)
+        else:
+            print_root(printer, part)
+    return list(receipts)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Background printing: a Spooler owns one worker thread and one bounded job queue per
+printer, so that submitting a receipt returns at once and a slow printer only delays
+its own jobs.
+
+    spooler = Spooler()
+    spooler.add_printer('kitchen', EscPosXMLPrinter(Network('10.0.0.12')))
+    job = spooler.submit('kitchen', xml)
+    job.wait(5)
+    job.status, job.queue_time, job.print_time
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from xml_escpos import receipt
+
+JOB_QUEUED = 'queued'
+JOB_PRINTING = 'printing'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+_STOP = object()  # tells a worker to exit
+
+_logger = logging.getLogger(__name__)
+
+
+class SpoolerFull(Exception):
+    """ the queue of the printer is full """
+
+
+class PrintJob(object):
+    """
+    Handle of a submitted receipt. status is one of JOB_QUEUED, JOB_PRINTING, JOB_DONE,
+    JOB_FAILED and JOB_CANCELLED; the exception of a failed job is in error. Times are
+    time.time() values, None until reached.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, printer_name, xml, options=None, journal_id=None):
+        self.id = next(self._ids)
+        self.printer_name = printer_name
+        self.xml = xml
+        self.options = options or {}
+        self.journal_id = journal_id  # id of the job in the JobJournal, if journaled
+        self.status = JOB_QUEUED
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._start_callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def queue_time(self):
+        """ seconds spent waiting in the queue """
+        if self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def print_time(self):
+        """ seconds spent rendering and writing the receipt """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """ waits for the job to end, returns whether it has """
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """ waits for the job to end and raises its error if it failed """
+        if not self.wait(timeout):
+            raise RuntimeError('Print job %d not done after %s seconds' % (self.id, timeout))
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def add_done_callback(self, callback):
+        """
+        calls callback(job) once the job has ended, at once if it has already. The
+        exceptions of the callbacks called by the job are logged.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def add_start_callback(self, callback):
+        """ calls callback(job) once the job has started printing, at once if it has already """
+        with self._lock:
+            if self.status == JOB_QUEUED:
+                self._start_callbacks.append(callback)
+                return
+            started = self.started is not None
+        if started:
+            callback(self)
+
+    def cancel(self):
+        """ cancels the job if it has not started yet, returns whether it was cancelled """
+        with self._lock:
+            if self.status != JOB_QUEUED:
+                return False
+            self.status = JOB_CANCELLED
+        self._finish()
+        return True
+
+    def _start(self):
+        """ marks the job as printing, returns False if it was cancelled """
+        with self._lock:
+            if self.status != JOB_QUEUED:
+                return False
+            self.status = JOB_PRINTING
+            self.started = time.time()
+            callbacks, self._start_callbacks = self._start_callbacks, []
+        self._call(callbacks)
+        return True
+
+    def _finish(self, error=None):
+        with self._lock:
+            self.finished = time.time()
+            if self.status == JOB_PRINTING:
+                self.status = JOB_DONE if error is None else JOB_FAILED
+            self.error = error
+            callbacks, self._callbacks = self._callbacks, []
+            self._start_callbacks = []
+            self._done.set()
+        self._call(callbacks)
+
+    def _call(self, callbacks):
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                # a failing callback must not stop the others, nor the printer worker
+                _logger.exception('Callback of print job %d failed', self.id)
+
+
+class PrinterWorker(object):
+    """ prints the jobs of one printer, in order, from a daemon thread """
+
+    def __init__(self, name, printer, maxsize=0, journal=None, monitor=None):
+        self.name = name
+        self.printer = printer
+        self.journal = journal
+        self.monitor = monitor
+        self.jobs = queue.Queue(maxsize)
+        self.printed = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name='xml-escpos-%s' % name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is _STOP:
+                return
+            if job._start():
+                self.print_job(job)
+
+    def print_job(self, job):
+        try:
+            if self.journal is not None and job.journal_id is not None:
+                self.journal.start(job.journal_id)
+            if self.monitor is not None:
+                with self.monitor.busy():
+                    receipt(self.printer, job.xml, **job.options)
+            else:
+                receipt(self.printer, job.xml, **job.options)
+        except Exception as e:
+            self.failed += 1
+            job._finish(e)
+        else:
+            self.printed += 1
+            job._finish()
+
+    def stop(self):
+        self.jobs.put(_STOP)
+
+
+class Spooler(object):
+    """
+    Prints receipts in the background. Each printer added gets a worker thread and a queue
+    of at most maxsize jobs (0 for unbounded), submit() blocks or raises SpoolerFull when
+    it is full. Jobs are printed buffered unless their options say otherwise, so the
+    receipt is rendered in memory before being written to the printer.
+    With a JobJournal, jobs are recorded before being queued so that replay() can print
+    the jobs left unfinished by a previous process; their receipt() options are not
+    recorded, replayed jobs are printed with the default ones.
+    A printer added with a StatusMonitor is not polled while printing, and jobs can be
+    rerouted from it to other printers while it is not ready.
+    """
+
+    def __init__(self, maxsize=100, journal=None):
+        self.maxsize = maxsize
+        self.journal = journal
+        self.workers = {}
+
+    def add_printer(self, name, printer, maxsize=None, monitor=None):
+        if name in self.workers:
+            raise ValueError('Printer already spooled: %s' % name)
+        self.workers[name] = PrinterWorker(name, printer, self.maxsize if maxsize is None else maxsize,
+                                           self.journal, monitor)
+
+    def ready(self, name):
+        """ whether the printer is ready according to its StatusMonitor, True without one """
+        monitor = self.workers[name].monitor
+        return monitor is None or monitor.ready
+
+    def submit(self, name, xml, block=False, timeout=None, fallbacks=(), **options):
+        """
+        Queues a receipt for the printer, returns its PrintJob. options are the keyword
+        arguments of receipt(). If the queue is full, waits up to timeout seconds for a
+        free place when block is True, and raises SpoolerFull otherwise.
+        If the printer is not ready, the job goes to the first ready printer of fallbacks;
+        it stays on the printer if none is ready.
+        """
+        if not self.ready(name):
+            for fallback in fallbacks:
+                if self.ready(fallback):
+                    name = fallback
+                    break
+        worker = self.workers[name]
+        options.setdefault('buffered', True)
+        journal_id = None
+        if self.journal is not None:
+            journal_id = self.journal.add(name, xml)
+        job = PrintJob(name, xml, options, journal_id)
+        try:
+            worker.jobs.put(job, block, timeout)
+        except queue.Full:
+            job.cancel()
+            raise SpoolerFull('Print queue of %s is full' % name)
+        finally:
+            if journal_id is not None:
+                job.add_done_callback(self._journal_end)
+        return job
+
+    def _journal_end(self, job):
+        if job.status == JOB_DONE:
+            self.journal.done(job.journal_id)
+        elif job.status == JOB_FAILED:
+            self.journal.failed(job.journal_id, job.error)
+        else:
+            self.journal.cancelled(job.journal_id)
+
+    def replay(self):
+        """
+        Queues again the journaled jobs that were not printed, oldest first, waiting for
+        room in the queues. To call on start, before submitting new jobs. Jobs of printers
+        not added to the spooler are left in the journal. Returns the PrintJobs queued.
+        """
+        jobs = []
+        for journal_id, name, xml, attempts in self.journal.unfinished():
+            worker = self.workers.get(name)
+            if worker is None:
+                continue
+            job = PrintJob(name, xml, {'buffered': True}, journal_id)
+            job.add_done_callback(self._journal_end)
+            worker.jobs.put(job)
+            jobs.append(job)
+        return jobs
+
+    def pending(self, name):
+        """ the number of jobs waiting for the printer """
+        return self.workers[name].jobs.qsize()
+
+    def stats(self):
+        return dict((name, {'pending': worker.jobs.qsize(), 'printed': worker.printed, 'failed': worker.failed})
+                    for name, worker in self.workers.items())
+
+    def close(self, wait=True, timeout=None):
+        """ stops the workers once the queued jobs are printed """
+        for worker in self.workers.values():
+            worker.stop()
+        if wait:
+            for worker in self.workers.values():
+                worker.thread.join(timeout)
+        if self.journal is not None:
+            self.journal.commit()
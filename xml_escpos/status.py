@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Monitoring the status of ESC/POS printers: online, paper, cover, errors. A StatusMonitor
+reads what the printer sends from a background thread, and keeps the last status it
+reported, so that checking a printer never waits for it. It enables automatic status
+back (GS a), with which the printer sends its status as soon as it changes, even while
+printing, and polls it with DLE EOT while it is idle.
+
+    monitor = escpos_monitor(printer.printer)
+    monitor.start()
+    monitor.status.ready, monitor.status.paper_near_end
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+DLE_EOT = b'\x10\x04'
+DLE_EOT_PRINTER = 1
+DLE_EOT_OFFLINE = 2
+DLE_EOT_ERROR = 3
+DLE_EOT_PAPER = 4
+GS_ASB = b'\x1d\x61'
+ASB_ALL = 0x0F  # drawer, online/offline, errors, paper roll sensor
+ASB_OFF = 0x00
+
+
+def _byte(n):
+    return bytes(bytearray([n]))
+
+
+class PrinterStatus(object):
+    """
+    A status reported by the printer. Each state is None until the printer has reported
+    it. updated is the time.time() of the last report, None if there was none.
+    """
+
+    def __init__(self):
+        self.online = None
+        self.cover_open = None
+        self.paper_out = None
+        self.paper_near_end = None
+        self.error = None
+        self.drawer_open = None
+        self.updated = None
+
+    @property
+    def ready(self):
+        """ whether the printer can print; an unknown printer is deemed ready """
+        return (self.online is not False and not self.cover_open and not self.paper_out and
+                not self.error)
+
+    def copy(self):
+        status = PrinterStatus()
+        status.__dict__.update(self.__dict__)
+        return status
+
+    def update_dle_eot(self, n, byte):
+        """ updates the status from the reply to DLE EOT n """
+        if n == DLE_EOT_PRINTER:
+            self.drawer_open = bool(byte & 0x04)
+            self.online = not byte & 0x08
+        elif n == DLE_EOT_OFFLINE:
+            self.cover_open = bool(byte & 0x04)
+            self.paper_out = bool(byte & 0x20)
+            self.error = bool(byte & 0x40)
+        elif n == DLE_EOT_ERROR:
+            self.error = bool(byte & 0x6C)
+        elif n == DLE_EOT_PAPER:
+            self.paper_near_end = bool(byte & 0x0C)
+            self.paper_out = bool(byte & 0x60)
+        self.updated = time.time()
+
+    def update_asb(self, data):
+        """ updates the status from the 4 bytes of an automatic status back """
+        self.drawer_open = bool(data[0] & 0x04)
+        self.online = not data[0] & 0x08
+        self.cover_open = bool(data[0] & 0x20)
+        self.error = bool(data[1] & 0x2C)
+        self.paper_near_end = bool(data[2] & 0x03)
+        self.paper_out = bool(data[2] & 0x0C)
+        self.updated = time.time()
+
+    def __repr__(self):
+        return '<PrinterStatus %s>' % ' '.join('%s=%s' % item for item in sorted(self.__dict__.items()))
+
+
+class StatusMonitor(object):
+    """
+    Keeps the status of a printer up to date. read() returns the bytes received from the
+    printer, None or raises socket.timeout when nothing was received before a timeout,
+    and returns b'' when the connection is closed; write(data) sends bytes to it and must
+    not be redirected by a print job. When the connection is closed or read() fails, the
+    printer is reported offline and read again after a delay doubling up to max_backoff.
+    The printer is polled every poll_interval seconds, unless it is printing (see busy())
+    or sent an automatic status back meanwhile. If it has not answered for stale_after
+    seconds it is reported offline. on_change(status) is called from the monitor threads
+    when the ready state of the printer changes.
+    """
+
+    def __init__(self, read, write, poll_interval=2.0, asb=True, stale_after=None, on_change=None,
+                 max_backoff=30.0):
+        self.read = read
+        self.write = write
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.asb = asb
+        self.stale_after = stale_after if stale_after is not None else 3 * poll_interval
+        self.on_change = on_change
+        self._status = PrinterStatus()
+        self.lock = threading.Lock()
+        self.queries = []  # the DLE EOT n sent and not answered yet, oldest first
+        self.received = bytearray()
+        self.printing = 0
+        self.running = False
+        self.started = None
+        self.wakeup = threading.Event()
+        self.threads = []
+
+    @property
+    def status(self):
+        """ a copy of the last status reported """
+        with self.lock:
+            return self._status.copy()
+
+    @property
+    def ready(self):
+        with self.lock:
+            return self._status.ready
+
+    def start(self):
+        self.running = True
+        self.started = time.time()
+        if self.asb:
+            self.write(GS_ASB + _byte(ASB_ALL))
+        for target, name in ((self._read_loop, 'reader'), (self._poll_loop, 'poller')):
+            thread = threading.Thread(target=target, name='xml-escpos-status-%s' % name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.asb:
+            try:
+                self.write(GS_ASB + _byte(ASB_OFF))
+            except Exception:
+                pass
+
+    @contextmanager
+    def busy(self):
+        """
+        Pauses the polling while the printer is printing, as a status request sent in the
+        middle of a command, e.g. an image, would be taken as part of it.
+        """
+        with self.lock:
+            self.printing += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.printing -= 1
+
+    def poll(self):
+        """ asks the printer for its status; the replies are handled by the reader thread """
+        queries = (DLE_EOT_PRINTER, DLE_EOT_OFFLINE, DLE_EOT_PAPER)
+        with self.lock:
+            self.queries = list(queries)  # the replies to the previous poll are not coming
+        self.write(b''.join(DLE_EOT + _byte(n) for n in queries))
+
+    def wait_ready(self, timeout=None, interval=0.05):
+        """ waits until the printer is ready, returns whether it is """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.ready:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def flow_wait(self, timeout=2.0):
+        """ a wait function for FlowControlWriter, waiting for the printer to be ready """
+        return lambda write: self.wait_ready(timeout)
+
+    def _poll_loop(self):
+        while self.running:
+            self.wakeup.wait(self.poll_interval)
+            if not self.running:
+                return
+            with self.lock:
+                updated = self._status.updated
+                printing = self.printing
+            if printing:
+                continue
+            since = self.started if updated is None else updated
+            if time.time() - since < self.poll_interval:
+                continue
+            try:
+                self.poll()
+            except Exception:
+                self._set(lambda status: setattr(status, 'online', False), touch=False)
+                continue
+            if time.time() - since > self.stale_after:
+                self._set(lambda status: setattr(status, 'online', False), touch=False)
+
+    def _read_loop(self):
+        backoff = self.poll_interval
+        while self.running:
+            try:
+                data = self.read()
+            except socket.timeout:
+                continue
+            except Exception:
+                data = b''
+            if data is None:
+                continue
+            if not data:
+                # closed or failing connection: retry later instead of spinning on it
+                self._set(lambda status: setattr(status, 'online', False), touch=False)
+                self.wakeup.wait(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+            backoff = self.poll_interval
+            self.received.extend(data)
+            self._parse()
+
+    def _parse(self):
+        received = self.received
+        while received:
+            byte = received[0]
+            if byte & 0x93 == 0x10:  # first byte of an automatic status back
+                if len(received) < 4:
+                    return
+                data = received[:4]
+                del received[:4]
+                self._set(lambda status: status.update_asb(data))
+            elif byte & 0x93 == 0x12:  # reply to DLE EOT
+                del received[:1]
+                with self.lock:
+                    n = self.queries.pop(0) if self.queries else None
+                if n is not None:
+                    self._set(lambda status: status.update_dle_eot(n, byte))
+            else:
+                del received[:1]  # not a status, e.g. the reply to another command
+
+    def _set(self, update, touch=True):
+        with self.lock:
+            status = self._status
+            was_ready = status.ready
+            updated = status.updated
+            update(status)
+            if not touch:
+                status.updated = updated
+            changed = status.ready != was_ready
+            snapshot = status.copy()
+        if changed and self.on_change is not None:
+            self.on_change(snapshot)
+
+
+def escpos_monitor(escpos, **kwargs):
+    """
+    A StatusMonitor of a python-escpos printer whose device is readable, as serial and
+    network printers are. The status requests bypass the output redirections of print jobs.
+    """
+    raw = type(escpos)._raw
+
+    def write(data):
+        raw(escpos, data)
+
+    def read():
+        data = escpos._read()
+        if not data and hasattr(getattr(escpos, 'device', None), 'in_waiting'):
+            return None  # a serial port read timed out, serial ports are never closed
+        return data
+    return StatusMonitor(read, write, **kwargs)